@@ -0,0 +1,58 @@
+''' Compare per call allocations and time of array and pointer arguments with and without argument pools.
+
+    python -m benchmarks.bench_arg_pool
+'''
+import ctypes
+import tempfile
+import timeit
+import tracemalloc
+from loial.builders.cc_builder import AsPointer, AsRef, CC_Config, cc_build
+
+CODE = '''
+long total(int a[], int n, long *out, int *scale) {
+    long sum = 0;
+    for (int i = 0; i < n; i++)
+        sum += a[i];
+    *out = sum * *scale;
+    return sum;
+}
+'''
+SIZE = 1000
+CALLS = 10000
+
+
+def make(pool, cache):
+    @cc_build(CODE, CC_Config(pool=pool, cache_search_path=[cache]))
+    def total(a: ctypes.c_int, n, out: ctypes.c_long, scale: ctypes.c_int) -> ctypes.c_long:
+        return sum(a)
+    return total
+
+
+def allocated_per_call(fun, args):
+    ''' Peak bytes allocated during a warm call, above the memory already held.'''
+    fun(*args)
+    tracemalloc.start()
+    try:
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fun(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - current
+
+
+def main():
+    values = list(range(SIZE))
+    with tempfile.TemporaryDirectory(prefix='loial_bench_') as cache:
+        for pool in (False, True):
+            fun = make(pool, cache)
+            args = (values, SIZE, AsPointer(0), AsRef(2))
+            allocated = allocated_per_call(fun, args)
+            seconds = timeit.timeit(lambda: fun(*args), number=CALLS)
+            print(f'pool={pool!s:5} allocated/call={allocated:8d} bytes '
+                  f'time/call={seconds / CALLS * 1e6:8.2f} us')
+
+
+if __name__ == '__main__':
+    main()
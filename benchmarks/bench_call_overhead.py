@@ -0,0 +1,34 @@
+''' Compare the per call overhead of the ctypes CC builder and the CPython extension CExt builder.
+
+    python -m benchmarks.bench_call_overhead
+'''
+import tempfile
+import timeit
+from loial.builders.cc_builder import CC_Config, cc_build
+from loial.builders.cext_builder import cext_build
+
+CODE = '''
+long add(long a, long b) {
+    return a + b;
+}
+'''
+CALLS = 200000
+
+
+def main():
+    with tempfile.TemporaryDirectory(prefix='loial_bench_') as cache:
+        config = CC_Config(cache_search_path=[cache])
+
+        def add(a, b):
+            return a + b
+
+        funs = {'python': add,
+                'CC': cc_build(CODE, config)(add),
+                'CExt': cext_build(CODE, config)(add)}
+        for name, fun in funs.items():
+            seconds = timeit.timeit(lambda: fun(1, 2), number=CALLS)
+            print(f'{name:6} time/call={seconds / CALLS * 1e9:8.1f} ns')
+
+
+if __name__ == '__main__':
+    main()
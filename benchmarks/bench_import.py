@@ -0,0 +1,37 @@
+''' Measure the latency of importing loial, against also importing every builder module eagerly.
+
+    python -m benchmarks.bench_import
+'''
+import statistics
+import subprocess
+import sys
+import time
+
+RUNS = 20
+STATEMENTS = {
+    'import loial': 'import loial',
+    'import all builders': 'import loial, loial.builders.python_builder, loial.builders.cc_builder, '
+                           'loial.builders.cext_builder',
+}
+
+
+def latency(statement):
+    ''' Median wall time of a fresh interpreter running the statement, less an empty interpreter.'''
+    times = []
+    for code in ('pass', statement):
+        runs = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], check=True)
+            runs.append(time.perf_counter() - start)
+        times.append(statistics.median(runs))
+    return times[1] - times[0]
+
+
+def main():
+    for name, statement in STATEMENTS.items():
+        print(f'{name:20} {latency(statement) * 1e3:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
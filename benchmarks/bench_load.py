@@ -0,0 +1,80 @@
+''' Compare the load time and mapped size of default and minimal_so shared objects.
+
+    python -m benchmarks.bench_load
+'''
+import _ctypes
+import ctypes
+import os
+import tempfile
+import time
+from loial.builders.cc_builder import CC_Config, cc_build
+
+CODE = '''
+#include <math.h>
+
+static const double weights[4096] = {{1.0, 0.5, 0.25}};
+
+double norm_{index}(const double *a, long n) {{
+    double total = 0.0;
+    for (long i = 0; i < n; i++) total += a[i] * a[i];
+    return sqrt(total);
+}}
+
+double weighted_{index}(const double *a, long n) {{
+    double total = 0.0;
+    for (long i = 0; i < n; i++) total += weights[i % 4096] * a[i];
+    return total;
+}}
+
+double kernel_{index}(double a, double b) {{
+    return a * {index} + b;
+}}
+'''
+LIBRARIES = 200
+ROUNDS = 5
+
+
+def make(index, cache, minimal_so):
+    def kernel(a, b):
+        ...
+    kernel.__name__ = kernel.__qualname__ = f'kernel_{index}'
+    config = CC_Config(cache_search_path=[cache], function=f'kernel_{index}', minimal_so=minimal_so,
+                       compiler_opts=['-fPIC', '-shared', '-O2'])
+    return cc_build(CODE.format(index=index), config)(kernel)
+
+
+def mapped(paths):
+    ''' The bytes of the process address space mapped from the paths.'''
+    size = 0
+    with open('/proc/self/maps') as maps:
+        for line in maps:
+            parts = line.split()
+            if len(parts) == 6 and parts[5] in paths:
+                start, end = parts[0].split('-')
+                size += int(end, 16) - int(start, 16)
+    return size
+
+
+def main():
+    for minimal_so in (False, True):
+        with tempfile.TemporaryDirectory(prefix='loial_bench_') as cache:
+            kernels = [make(i, cache, minimal_so) for i in range(LIBRARIES)]
+            paths = [kernel.callable.library_file for kernel in kernels]
+            for kernel in kernels:
+                kernel.callable.unload()
+            times = []
+            for _ in range(ROUNDS):
+                start = time.perf_counter()
+                libraries = [ctypes.CDLL(path) for path in paths]
+                times.append(time.perf_counter() - start)
+                size = mapped(set(paths))
+                for library in libraries:
+                    _ctypes.dlclose(library._handle)
+            files = sum(os.path.getsize(path) for path in paths)
+            print(f'minimal_so={minimal_so!s:5} load {min(times) / LIBRARIES * 1e6:7.1f} us'
+                  f'  mapped {size / LIBRARIES / 1024:6.1f} KiB  file {files / LIBRARIES / 1024:6.1f} KiB'
+                  f'  per library')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+''' Compare a CPU bound kernel holding the GIL called in turn, from threads and with pool_map.
+
+    python -m benchmarks.bench_pool_map
+'''
+import ctypes
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from loial.builders.cc_builder import CC_Config, cc_build
+from loial.builders.cc_pool import SharedArray, pool
+
+CODE = '''
+double spin(const double *values, long start, long n, long rounds) {
+    double total = 0;
+    for (long r = 0; r < rounds; r++)
+        for (long i = start; i < start + n; i++)
+            total += values[i] * (r + 1);
+    return total;
+}
+'''
+SIZE = 1 << 20
+TASKS = 32
+ROUNDS = 50
+
+
+def make(cache):
+    @cc_build(CODE, CC_Config(gil='hold', cache_search_path=[cache]))
+    def spin(values: ctypes.c_double, start, n, rounds) -> ctypes.c_double:
+        ...
+    return spin
+
+
+def main():
+    with tempfile.TemporaryDirectory(prefix='loial_bench_') as cache, \
+            SharedArray(ctypes.c_double, range(SIZE)) as values:
+        spin = make(cache)
+        step = SIZE // TASKS
+        tasks = [(values.array, i * step, step, ROUNDS) for i in range(TASKS)]
+        pool.start()
+
+        start = time.perf_counter()
+        serial = [spin(*task) for task in tasks]
+        print(f'serial   {time.perf_counter() - start:8.3f} s')
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor() as executor:
+            threaded = list(executor.map(lambda task: spin(*task), tasks))
+        print(f'threads  {time.perf_counter() - start:8.3f} s')
+
+        start = time.perf_counter()
+        pooled = spin.pool_map((values, i * step, step, ROUNDS) for i in range(TASKS))
+        print(f'pool_map {time.perf_counter() - start:8.3f} s')
+        assert serial == threaded == pooled
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+''' Compare calling a kernel per record with streaming records through chunked batch calls.
+
+    python -m benchmarks.bench_stream
+'''
+import tempfile
+import time
+from loial.builders.cc_builder import CC_Config, cc_build
+
+CODE = '''
+double score(long id, double value, double weight) {
+    return (id % 7) * value + weight;
+}
+'''
+RECORDS = 200000
+
+
+def make(cache):
+    @cc_build(CODE, CC_Config(cache_search_path=[cache]))
+    def score(id, value, weight):
+        ...
+    return score
+
+
+def records():
+    for i in range(RECORDS):
+        yield i, i * 0.5, 1.0
+
+
+def main():
+    with tempfile.TemporaryDirectory(prefix='loial_bench_') as cache:
+        score = make(cache)
+        start = time.perf_counter()
+        total = sum(score(*record) for record in records())
+        print(f'per call              {time.perf_counter() - start:8.3f} s')
+        for double_buffer in (False, True):
+            start = time.perf_counter()
+            streamed = sum(score.stream(records(), chunk_size=4096, double_buffer=double_buffer))
+            print(f'stream double_buffer={double_buffer!s:5} {time.perf_counter() - start:8.3f} s')
+            assert streamed == total
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+''' Measure call throughput of a native kernel from 1 to 8 threads, on GIL and free-threaded interpreters.
+
+    python -m benchmarks.bench_threads
+'''
+import ctypes
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from loial.builders.cc_builder import CC_Config, cc_build
+
+CODE = '''
+double work(long n) {
+    double total = 0;
+    for (long i = 1; i <= n; i++)
+        total += 1.0 / i;
+    return total;
+}
+'''
+CALLS = 2000
+SPIN = 20000
+
+
+def make(cache, gil):
+    @cc_build(CODE, CC_Config(gil=gil, cache_search_path=[cache]))
+    def work(n) -> ctypes.c_double:
+        ...
+    return work
+
+
+def main():
+    gil_enabled = sys._is_gil_enabled() if hasattr(sys, '_is_gil_enabled') else True
+    print(f'python {sys.version.split()[0]} gil_enabled={gil_enabled}')
+    with tempfile.TemporaryDirectory(prefix='loial_bench_') as cache:
+        for gil in ('release', 'hold'):
+            work = make(cache, gil)
+            for threads in (1, 2, 4, 8):
+                with ThreadPoolExecutor(threads) as executor:
+                    start = time.perf_counter()
+                    list(executor.map(lambda _: work(SPIN), range(CALLS)))
+                    seconds = time.perf_counter() - start
+                print(f'gil={gil:7} threads={threads} calls/s={CALLS / seconds:10.0f}')
+
+
+if __name__ == '__main__':
+    main()
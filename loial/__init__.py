@@ -1 +1 @@
-from loial.builder import build
+from loial.builder import build, Memoize
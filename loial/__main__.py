@@ -0,0 +1,51 @@
+''' Command line tools.
+
+    python -m loial report [path ...]
+
+    Print the optimization reports of compiled functions. A path is a compiled library, its .opt.json
+    report or a cache directory, by default the CC_Config cache.
+'''
+import argparse
+import glob
+import json
+import os
+import sys
+
+
+def reports(paths):
+    ''' Yield the report files for library, report and directory paths.'''
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(glob.glob(os.path.join(path, '*.opt.json')))
+        elif path.endswith('.opt.json'):
+            yield path
+        else:
+            yield f'{path}.opt.json'
+
+
+def report(args):
+    from loial.builders import cc_remarks
+    from loial.builders.cc_builder import CC_Config
+    found = False
+    for path in reports(args.paths or [str(CC_Config().cache)]):
+        if not os.path.exists(path):
+            print(f'No report: {path}', file=sys.stderr)
+            continue
+        with open(path) as file:
+            print(cc_remarks.describe(json.load(file), os.path.basename(path)[:-len('.opt.json')]))
+        found = True
+    return 0 if found else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m loial')
+    commands = parser.add_subparsers(dest='command', required=True)
+    report_parser = commands.add_parser('report', help='print optimization reports of compiled functions')
+    report_parser.add_argument('paths', nargs='*', help='libraries, reports or cache directories')
+    report_parser.set_defaults(run=report)
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
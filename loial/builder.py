@@ -1,20 +1,184 @@
-from .builders import *
+from .builders import BaseBuilder, get_builder
+import functools
 import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
 
 logger = logging.getLogger(__name__)
 
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class Memoize:
+    ''' Bounded LRU cache of call results, with an optional time to live.
+
+        Only calls whose arguments are all hashable scalars are cached, calls passing arrays, buffers,
+        pointers or callbacks always run.
+
+        Args:
+            size (int): The maximum number of cached results. [128]
+            ttl (float): Seconds before a cached result expires, None never expires. [None]
+    '''
+
+    scalars = (int, float, complex, bool, str, bytes, type(None))
+
+    def __init__(self, size=128, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def of(memoize):
+        ''' Create the cache of a wrapper from a build memoize option: True, a size or a Memoize, whose
+            size and ttl are copied so wrappers built with the same Memoize do not share results.'''
+        if not memoize:
+            return None
+        if isinstance(memoize, Memoize):
+            return Memoize(size=memoize.size, ttl=memoize.ttl)
+        if memoize is True:
+            return Memoize()
+        return Memoize(size=memoize)
+
+    def get(self, key):
+        ''' Get the cached result and whether it was found.'''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], True
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None, False
+
+    def put(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.size, len(self.entries))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
 
 class Wrapper:
     ''' Wrapper class to execute the compiled code.'''
 
-    def __init__(self, callable):
+    executor = None
+    ''' The executor used by async_call, None uses the event loop default thread pool.'''
+
+    def __init__(self, callable, memoize=None, fun=None):
         self.callable = callable
+        self.memo = Memoize.of(memoize)
+        if self.memo:
+            import inspect
+            self.sig = inspect.signature(fun if fun else callable)
 
     def __call__(self, *args, **kwargs):
-        return self.callable(*args, **kwargs)
+        if self.memo is None:
+            return self.callable(*args, **kwargs)
+        key = self.memo_key(args, kwargs)
+        if key is None:
+            return self.callable(*args, **kwargs)
+        value, found = self.memo.get(key)
+        if not found:
+            value = self.callable(*args, **kwargs)
+            self.memo.put(key, value)
+        return value
+
+    def memo_key(self, args, kwargs):
+        ''' The cache key of a call: its arguments bound to the signature with defaults, or None
+            when an argument is not a hashable scalar.'''
+        if kwargs or len(args) != len(self.sig.parameters):
+            try:
+                bound = self.sig.bind(*args, **kwargs)
+            except TypeError:
+                return None
+            bound.apply_defaults()
+            args = bound.args
+        for arg in args:
+            if not isinstance(arg, Memoize.scalars):
+                return None
+        return args
+
+    def swap(self, callable):
+        ''' Replace the callable, such as with a rebuilt function, clearing memoized results.'''
+        self.callable = callable
+        self.cache_clear()
+
+    @property
+    def opt_report(self):
+        ''' The compiler optimization report of the compiled function, None when not collected.'''
+        return getattr(self.callable, 'opt_report', None)
+
+    def cache_info(self):
+        ''' The memoize hit and miss counters, None when not memoized.'''
+        return self.memo.info() if self.memo else None
+
+    def cache_clear(self):
+        if self.memo:
+            self.memo.clear()
+
+    def pool_map(self, args, chunksize=1):
+        ''' Call for each argument tuple in a pool of worker processes, for kernels that hold the GIL or
+            call back into Python. Callables without process pool support are called in turn.
+
+            Args:
+                args (iterable): Argument tuples, or single arguments, for each call.
+                chunksize (int): The number of calls sent to a worker at a time. [1]
+
+            Returns:
+                list: The results in the order of the arguments.
+        '''
+        pool_map = getattr(self.callable, 'pool_map', None)
+        if pool_map is not None:
+            return pool_map(args, chunksize)
+        return [self(*(item if isinstance(item, tuple) else (item,))) for item in args]
+
+    def stream(self, iterable, chunk_size=1024, double_buffer=False):
+        ''' Call for each argument tuple, or single argument, of an iterable, yielding the results lazily.
+
+            Compiled functions pack chunks of arguments into reusable typed buffers for one native call
+            per chunk, with double_buffer packing the next chunk in a background thread. Other callables
+            are called per item.
+
+            Args:
+                iterable (iterable): Argument tuples, or single arguments, for each call.
+                chunk_size (int): The number of items per native call. [1024]
+                double_buffer (bool): Pack the next chunk while the current one is processed. [False]
+        '''
+        stream = getattr(self.callable, 'stream', None)
+        if stream is not None:
+            return stream(iterable, chunk_size, double_buffer)
+        return (self(*(item if isinstance(item, tuple) else (item,))) for item in iterable)
+
+    async def async_call(self, *args, **kwargs):
+        ''' Call from a coroutine without blocking the event loop.
+
+            The call runs in the executor thread pool, so native code that releases the GIL overlaps with
+            the event loop. Callables that declare they hold the GIL are called directly, as a thread
+            would not run concurrently.
+        '''
+        import asyncio
+        if getattr(self.callable, 'releases_gil', True) is False:
+            return self.callable(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(Wrapper.executor, functools.partial(self.callable, *args, **kwargs))
 
 
-def build(code=None, code_type='Python', config=None, replace=True):
+def build(code=None, code_type='Python', config=None, replace=True, memoize=None):
     ''' Decorator to build a function dynamically with provided code.
 
         Args:            
@@ -22,6 +186,9 @@ def build(code=None, code_type='Python', config=None, replace=True):
             code_type (str): Type of the code, default is 'Python'.
             config (class): Options for the builder. This instance type is builder specific
             replace (bool): If True, replaces the function body with the provided code.
+            memoize (bool, int or Memoize): Cache results of pure functions by their scalar arguments,
+                True for the default size, a size or a Memoize with a size and ttl. Each wrapper has its
+                own cache, a Memoize only gives the settings, use Wrapper.cache_info for the counters.
 
         Returns:
             function: A wrapper function that executes the provided code.
@@ -29,10 +196,10 @@ def build(code=None, code_type='Python', config=None, replace=True):
 
     compiler = None
     if replace:
-        for subclass in BaseBuilder.__subclasses__():
-            if subclass.__name__.startswith(f'{code_type}_'):
-                logger.debug(f'Using compiler: {subclass.__name__}')
-                compiler = subclass(code, config)
+        builder = get_builder(code_type)
+        if builder:
+            logger.debug(f'Using compiler: {builder.__name__}')
+            compiler = builder(code, config)
 
     if not compiler:
         logger.debug(f'Not replacing code')
@@ -51,6 +218,9 @@ def build(code=None, code_type='Python', config=None, replace=True):
             callable := compiler.compile(fun)) else fun
         logger.debug(f'Using callable: {callable}')
 
-        return Wrapper(callable)
+        wrapper = Wrapper(callable, memoize, fun)
+        if compiler and callable is compiler:
+            compiler.attach(wrapper)
+        return wrapper
 
     return fun_wrapper
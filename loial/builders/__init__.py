@@ -1,8 +1,84 @@
-from .builder import BaseBuilder   
+from .builder import BaseBuilder
 
-import pkgutil
 import importlib
+import logging
+import threading
 
-# Import all submodules in this package
-for loader, module_name, is_pkg in pkgutil.walk_packages(__path__, __name__ + "."):
-    module = importlib.import_module(module_name)
+__all__ = ['BaseBuilder', 'get_builder', 'register_builder']
+
+logger = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = 'loial.builders'
+''' Entry point group for third party builders, the entry point name is the code_type:
+
+    [project.entry-points."loial.builders"]
+    Rust = "loial_rust.builder:Rust_Builder"
+'''
+
+_registry = {
+    'Python': 'loial.builders.python_builder:Python_Builder',
+    'CC': 'loial.builders.cc_builder:CC_Builder',
+    'CExt': 'loial.builders.cext_builder:CExt_Builder',
+    'PyC': 'loial.builders.pyc_builder:PyC_Builder',
+}
+_lock = threading.Lock()
+_entry_points_loaded = False
+
+
+def register_builder(code_type, builder):
+    ''' Register a builder for a code_type.
+
+        Args:
+            code_type (str): The code_type passed to build.
+            builder (type or str): A BaseBuilder subclass, or a lazy "module:Class" reference imported on first use.
+    '''
+    with _lock:
+        _registry[code_type] = builder
+
+
+def _load_entry_points():
+    global _entry_points_loaded
+    from importlib.metadata import entry_points
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        with _lock:
+            _registry.setdefault(entry_point.name, entry_point.value)
+    _entry_points_loaded = True
+
+
+def _find_subclass(code_type, base=BaseBuilder):
+    ''' Find an unregistered builder subclass by the <code_type>_ name prefix.'''
+    for subclass in base.__subclasses__():
+        if subclass.__name__.startswith(f'{code_type}_'):
+            return subclass
+        found = _find_subclass(code_type, subclass)
+        if found:
+            return found
+    return None
+
+
+def get_builder(code_type):
+    ''' Resolve the builder class for a code_type, importing only the module that defines it.
+
+        Registered and built in builders are found first, then entry points and then already imported
+        BaseBuilder subclasses named <code_type>_*.
+
+        Returns:
+            type: The builder class, or None if there is no builder for the code_type.
+    '''
+    builder = _registry.get(code_type)
+    if builder is None and not _entry_points_loaded:
+        _load_entry_points()
+        builder = _registry.get(code_type)
+    if builder is None:
+        builder = _find_subclass(code_type)
+        if builder is None:
+            return None
+    if isinstance(builder, str):
+        module_name, _, name = builder.partition(':')
+        try:
+            builder = getattr(importlib.import_module(module_name), name)
+        except (ImportError, AttributeError):
+            logger.error(f'Unable to load builder for {code_type}: {module_name}:{name}', exc_info=True)
+            return None
+    register_builder(code_type, builder)
+    return builder
@@ -20,3 +20,11 @@ class BaseBuilder:
             self: The instance of the compiler with compiled code.
         '''
         pass
+
+    def attach(self, wrapper):
+        ''' Called with the Wrapper of the compiled function, so builders can later swap its callable.
+
+        Args:
+            wrapper (Wrapper): The wrapper returned by build.
+        '''
+        pass
@@ -1,24 +1,43 @@
+import ast
 import glob
 import pathlib
 import shutil
+import sys
 import tempfile
 import subprocess
+import sysconfig
 import ctypes
+import _ctypes
 import inspect
 import os
 import logging
+import math
 import hashlib
-from copy import deepcopy
+import json
+import functools
+import itertools
+import mmap
+import platform
+import queue
+import re
+import threading
+import time
+import types
+import typing
+import operator
+import weakref
+from copy import copy, deepcopy
 from pathlib import Path
 from .builder import BaseBuilder
+from . import cc_prototype, cc_remarks
 
 logger = logging.getLogger(__name__)
 
 
-def cc_build(code='',  config=None, replace=True):
+def cc_build(code='', config=None, replace=True, memoize=None):
     """ Helper decorator to default the code_type t0 'CC' """
     from ..builder import build
-    return build(code, code_type='CC', config=config, replace=replace)
+    return build(code, code_type='CC', config=config, replace=replace, memoize=memoize)
 
 
 def c_struct(cls):
@@ -29,6 +48,25 @@ def c_struct(cls):
     return type(cls.__name__,  (C_Struct,) + cls.__bases__, cls_dict)
 
 
+def c_columns(cls):
+    """ Class decorator to build a struct-of-arrays C_Columns container.
+
+    Accepts an annotated class, as for c_struct, or an existing C_Struct. Annotated classes
+    keep their name for the columns and the row struct is named <name>Row, otherwise the
+    columns are named <struct>Columns.
+    """
+    if isinstance(cls, type) and issubclass(cls, C_Struct):
+        record, name = cls, f'{cls.__name__}Columns'
+    else:
+        record, name = c_struct(cls), cls.__name__
+        record.__name__ = record.__qualname__ = f'{name}Row'
+    fields = [(field, ctypes.POINTER(c_type)) for field, c_type in record._fields_]
+    if 'length' in (field for field, _ in fields):
+        raise ValueError(f'Column name "length" is reserved: {name}')
+    return type(name, (C_Columns,), {'_fields_': fields + [('length', ctypes.c_size_t)],
+                                     '_record_': record})
+
+
 class C_Struct(ctypes.Structure):
     """ Class mix-in to generate C structs from ctype fields.
 
@@ -67,6 +105,14 @@ class C_Struct(ctypes.Structure):
         b: ctypes.c_float
         multi: LocalInnerStruct
 
+    Contiguous arrays of structs are passed by pointer without per element conversion.
+    They can be built from a list or viewed over an existing writable buffer or mmap:
+
+        points = Point.array([p1, p2, p3])
+        points = Point.view(bytearray(ctypes.sizeof(Point) * 3))
+
+    define() also emits the typedefs of nested structs in dependency order.
+
     """
 
     def match_type(c_type):
@@ -116,14 +162,266 @@ class C_Struct(ctypes.Structure):
             case _:
                 return c_type.__name__
 
+    @staticmethod
+    def declare(c_type, name):
+        ''' Declare a C field of a ctypes type, including fixed size arrays and pointers. '''
+        dims = ''
+        while issubclass(c_type, ctypes.Array):
+            dims += f'[{c_type._length_}]'
+            c_type = c_type._type_
+        if issubclass(c_type, ctypes._Pointer):
+            return f'{C_Struct.match_type(c_type._type_)} *{name}{dims}'
+        return f'{C_Struct.match_type(c_type)} {name}{dims}'
+
     @classmethod
-    def define(cls):
+    def dependencies(cls, found=None):
+        ''' List this struct and the C_Structs it nests, in dependency order. '''
+        found = [] if found is None else found
+        for _, c_type in cls._fields_:
+            while issubclass(c_type, (ctypes.Array, ctypes._Pointer)):
+                c_type = c_type._type_
+            if issubclass(c_type, C_Struct) and c_type not in found:
+                c_type.dependencies(found)
+        if cls not in found:
+            found.append(cls)
+        return found
+
+    @classmethod
+    def typedef(cls):
+        ''' Generate the guarded C typedef for this struct only. '''
+        pack = getattr(cls, '_pack_', None)
+        body = f'''typedef struct {{
+\t{';\n\t'.join((C_Struct.declare(field[1], field[0]) for field in cls._fields_))};
+}} {cls.__name__};'''
+        if pack:
+            body = f'#pragma pack(push, {pack})\n{body}\n#pragma pack(pop)'
         return f'''
-typedef struct {{
-\t{';\n\t'.join((C_Struct.match_type(field[1])+' '+field[0] for field in cls._fields_))};
-}} {cls.__name__};
+#ifndef LOIAL_STRUCT_{cls.__name__}
+#define LOIAL_STRUCT_{cls.__name__}
+{body}
+#endif
 '''
 
+    @classmethod
+    def define(cls):
+        ''' Generate the C typedefs for this struct and any nested structs in dependency order.
+            Typedefs are guarded, so defining the same struct more than once is harmless.'''
+        return ''.join(dep.typedef() for dep in cls.dependencies())
+
+    @classmethod
+    def array(cls, values):
+        ''' Create a contiguous C array of this struct from a list of instances, or a zeroed array of a given length.'''
+        if isinstance(values, int):
+            return (cls * values)()
+        return (cls * len(values))(*values)
+
+    @classmethod
+    def view(cls, buffer, count=None, offset=0):
+        ''' View a writable buffer (bytearray, mmap, ...) as a C array of this struct without copying.'''
+        if count is None:
+            count = (memoryview(buffer).nbytes - offset) // ctypes.sizeof(cls)
+        return (cls * count).from_buffer(buffer, offset)
+
+
+class C_Columns(C_Struct):
+    """ Struct-of-arrays container, each field of a row struct is stored in its own contiguous buffer.
+
+    Built with the c_columns decorator, the C typedef holds one pointer per field and the row count,
+    so kernels can stream over a single field:
+
+        @c_columns
+        class Trades():
+            price: ctypes.c_double
+            size: ctypes.c_int
+
+        @cc_build(Trades.define() + r'''
+        double notional(Trades t) {
+            double total = 0;
+            for (size_t i = 0; i < t.length; i++)
+                total += t.price[i] * t.size[i];
+            return total;
+        }
+        ''')
+        def notional(t) -> ctypes.c_double:
+            ...
+
+        trades = Trades.from_rows([(10.5, 3), (11.0, 2)])
+        trades.column('price')[:] = [10.0, 11.0]
+        trades[0] = (9.5, 4)
+        notional(trades)
+    """
+
+    _record_ = None
+
+    def __init__(self, length=0):
+        ctypes.Structure.__init__(self)
+        self._columns = {}
+        for name, pointer in self._fields_[:-1]:
+            column = (pointer._type_ * length)()
+            self._columns[name] = column
+            setattr(self, name, ctypes.cast(column, pointer))
+        self.length = length
+
+    @classmethod
+    def from_rows(cls, rows):
+        ''' Create the columns from row structs or tuples in field order.'''
+        rows = list(rows)
+        columns = cls(len(rows))
+        for i, row in enumerate(rows):
+            columns[i] = row
+        return columns
+
+    def column(self, name):
+        ''' Get the contiguous ctypes array holding a field.'''
+        return self._columns[name]
+
+    def set_column(self, name, values):
+        ''' Replace all values of a field.'''
+        self._columns[name][:] = values
+
+    def _index(self, index):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(f'Row index out of range: {index}')
+        return index
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        index = self._index(index)
+        return self._record_(*(column[index] for column in self._columns.values()))
+
+    def __setitem__(self, index, row):
+        index = self._index(index)
+        values = row if isinstance(row, tuple) else (
+            getattr(row, name) for name in self._columns)
+        for column, value in zip(self._columns.values(), values):
+            column[index] = value
+
+    def __iter__(self):
+        return (self[i] for i in range(self.length))
+
+
+def known_types(sig):
+    ''' Map struct names used in the hints of a signature to their types.'''
+    known = {}
+    hints = [param.annotation for param in sig.parameters.values()]
+    for hint in hints + [sig.return_annotation]:
+        if isinstance(hint, type) and issubclass(hint, C_Struct):
+            known.update((dep.__name__, dep) for dep in hint.dependencies())
+        elif isinstance(hint, type) and issubclass(hint, ctypes.Structure):
+            known[hint.__name__] = hint
+    return known
+
+
+@functools.lru_cache(maxsize=1024)
+def _encode(text, encoding):
+    ''' Encode str arguments once, repeated values reuse the cached bytes.'''
+    return text.encode(encoding)
+
+
+class _Py_buffer(ctypes.Structure):
+    _fields_ = [('buf', ctypes.c_void_p),
+                ('obj', ctypes.c_void_p),
+                ('len', ctypes.c_ssize_t),
+                ('itemsize', ctypes.c_ssize_t),
+                ('readonly', ctypes.c_int),
+                ('ndim', ctypes.c_int),
+                ('format', ctypes.c_char_p),
+                ('shape', ctypes.c_void_p),
+                ('strides', ctypes.c_void_p),
+                ('suboffsets', ctypes.c_void_p),
+                ('internal', ctypes.c_void_p)]
+
+
+class _BufferHold():
+    ''' Holds an exported buffer until the pointer referencing it is released.'''
+
+    def __init__(self, buffer):
+        self.view = _Py_buffer()
+        ctypes.pythonapi.PyObject_GetBuffer(
+            ctypes.py_object(buffer), ctypes.byref(self.view), ctypes.c_int(0))
+
+    def __del__(self):
+        ctypes.pythonapi.PyBuffer_Release(ctypes.byref(self.view))
+
+
+def buffer_pointer(buffer, c_type=ctypes.c_char):
+    ''' Get a typed pointer to the storage of a contiguous buffer without copying.
+
+        Unlike from_buffer this also works for read-only buffers such as bytes, read-only
+        memoryviews and mmaps. The buffer stays exported while the pointer is referenced.
+    '''
+    hold = _BufferHold(buffer)
+    pointer = ctypes.cast(hold.view.buf, ctypes.POINTER(c_type))
+    pointer._buffer = hold
+    return pointer
+
+
+class MappedArray():
+    """ A typed array over a memory mapped file, passed to C as a pointer without reading it into Python.
+
+    The source can be a file path or an existing mmap. Modes are 'r' read-only, 'w' shared writes
+    back to the file and 'c' copy-on-write, where writes are private to the mapping:
+
+        @cc_build('''
+        long total(const int *data, size_t n) {
+            ...
+        }
+        ''', CC_Config(lengths={'n': 'data'}))
+        def total(data: ctypes.c_int, n):
+            ...
+
+        with MappedArray('values.bin', ctypes.c_int) as data:
+            total(data)
+
+    Alternatively paths can be mapped automatically with a config mapped entry:
+
+        CC_Config(mapped={'data': 'r'}, lengths={'n': 'data'})
+
+        total('values.bin')
+    """
+
+    modes = {'r': mmap.ACCESS_READ, 'w': mmap.ACCESS_WRITE, 'c': mmap.ACCESS_COPY}
+
+    def __init__(self, source, c_type=None, mode='r', offset=0, length=0):
+        if mode not in MappedArray.modes:
+            raise ValueError(f'Unknown mapping mode: {mode}')
+        self.c_type = c_type
+        self.mode = mode
+        if isinstance(source, mmap.mmap):
+            self.mmap = source
+        else:
+            with open(source, 'r+b' if mode == 'w' else 'rb') as file:
+                self.mmap = mmap.mmap(file.fileno(), length,
+                                      access=MappedArray.modes[mode], offset=offset)
+
+    def count(self, c_type=None):
+        ''' The number of elements of the given or mapped type.'''
+        c_type = c_type or self.c_type
+        return len(self.mmap) // (ctypes.sizeof(c_type) if c_type else 1)
+
+    def pointer(self, c_type=None):
+        ''' Get a typed pointer to the mapped memory.'''
+        c_type = c_type or self.c_type or ctypes.c_char
+        if self.mode == 'r':
+            return buffer_pointer(self.mmap, c_type)
+        return (c_type * self.count(c_type)).from_buffer(self.mmap)
+
+    def __len__(self):
+        return self.count()
+
+    def close(self):
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 
 class AsPointer():
     def __init__(self, value):
@@ -141,6 +439,172 @@ class AsRef():
         return self.value
 
 
+class CC_Metrics():
+    """ Process wide compile metrics.
+
+    Attributes:
+        compiles (int): Successful compiles by the compiler, including launcher cache misses.
+        launcher_hits (int): Compiles served from the compiler launcher cache.
+        failures (int): Failed compiles.
+        seconds (float): Total time spent compiling.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.compiles = 0
+            self.launcher_hits = 0
+            self.failures = 0
+            self.seconds = 0.0
+
+    def record(self, counter, seconds):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+            self.seconds += seconds
+
+    def as_dict(self):
+        with self.lock:
+            return {'compiles': self.compiles, 'launcher_hits': self.launcher_hits,
+                    'failures': self.failures, 'seconds': self.seconds}
+
+
+metrics = CC_Metrics()
+
+
+class CC_Libraries():
+    """ Process wide table of loaded shared libraries.
+
+    Builders loading the same shared object path share one handle, which is reference counted and
+    closed with dlclose when the last builder releases it, keeping mapped libraries bounded when
+    functions are re-decorated.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.handles = {}
+
+    def acquire(self, path, loader=ctypes.CDLL):
+        ''' Load, or share the already loaded, library for a path.'''
+        key = (os.path.abspath(path), loader)
+        with self.lock:
+            entry = self.handles.get(key)
+            if entry is None:
+                entry = self.handles[key] = [loader(path), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, path, loader=ctypes.CDLL):
+        ''' Release a library, closing it when it is no longer used.'''
+        key = (os.path.abspath(path), loader)
+        with self.lock:
+            entry = self.handles.get(key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self.handles[key]
+        logger.debug(f'Closing shared library: {path}')
+        CC_Libraries.close(entry[0])
+
+    def loaded(self, path):
+        ''' Whether a library is loaded by any loader.'''
+        path = os.path.abspath(path)
+        with self.lock:
+            return any(key[0] == path for key in self.handles)
+
+    def count(self, path, loader=ctypes.CDLL):
+        ''' The number of builders using a library.'''
+        entry = self.handles.get((os.path.abspath(path), loader))
+        return entry[1] if entry else 0
+
+    @staticmethod
+    def close(library):
+        if os.name == 'nt':
+            _ctypes.FreeLibrary(library._handle)
+        else:
+            _ctypes.dlclose(library._handle)
+
+
+libraries = CC_Libraries()
+
+# /proc/cpuinfo flags required by each -march level
+CPU_FEATURES = {
+    'x86-64-v2': {'cx16', 'lahf_lm', 'popcnt', 'sse4_1', 'sse4_2', 'ssse3'},
+    'x86-64-v3': {'cx16', 'lahf_lm', 'popcnt', 'sse4_1', 'sse4_2', 'ssse3', 'avx', 'avx2', 'bmi1', 'bmi2',
+                  'f16c', 'fma', 'abm', 'movbe', 'xsave'},
+    'x86-64-v4': {'cx16', 'lahf_lm', 'popcnt', 'sse4_1', 'sse4_2', 'ssse3', 'avx', 'avx2', 'bmi1', 'bmi2',
+                  'f16c', 'fma', 'abm', 'movbe', 'xsave', 'avx512f', 'avx512bw', 'avx512cd', 'avx512dq',
+                  'avx512vl'},
+}
+
+CPU_VARIANTS = {
+    'x86_64': ('x86-64-v4', 'x86-64-v3'),
+    'amd64': ('x86-64-v4', 'x86-64-v3'),
+}
+
+
+class CC_Watcher():
+    """ Background poller rebuilding watched functions when their inputs change.
+
+    Wrappers of builds with the watch option are polled every interval seconds from a daemon thread. A
+    changed build is recompiled in the poller thread under a versioned file name and swapped into the
+    wrapper, calls in flight finish on the previous library.
+    """
+
+    interval = 1.0
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.polling = threading.Lock()
+        self.wrappers = weakref.WeakSet()
+        self.thread = None
+
+    def watch(self, wrapper):
+        ''' Watch a wrapper, starting the poller thread on first use.'''
+        with self.lock:
+            self.wrappers.add(wrapper)
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name='loial-watcher', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception:
+                logger.error('Error polling watched builds', exc_info=True)
+
+    def poll(self):
+        ''' Rebuild and swap the changed builds once, returning the number swapped.'''
+        with self.polling:
+            return self.rebuild()
+
+    def rebuild(self):
+        with self.lock:
+            wrappers = list(self.wrappers)
+        swapped = 0
+        for wrapper in wrappers:
+            builder = wrapper.callable
+            if not isinstance(builder, CC_Builder) or not builder.changed():
+                continue
+            rebuilt = builder.reload()
+            if rebuilt:
+                wrapper.swap(rebuilt)
+                swapped += 1
+                if builder.version:
+                    builder.clean()
+        return swapped
+
+
+watcher = CC_Watcher()
+
+
 class CC_Config():
     """
     Configuration class for managing the cache directory used by C_Builder.
@@ -175,11 +639,42 @@ class CC_Config():
         cache_search_path (str,..): List of directory paths (as strings) to search for or create as the cache location.
         cache (Path or None): The resolved cache directory path, or None if not yet set.
         compiler (str): The compiler command. [cc]
+        launcher (str): A compiler launcher command such as ccache or sccache, 'auto' to use either when found
+            on the PATH. Launched compiles run from the cache directory with relative paths. [None]
         compiler_opts (str,..): Compiler options. ["-fPIC", "-shared", "-xc"]
         delete_on_exit (bool): The default delete_on_exit value if not set per build. [False]
         function (str): The function name to call, if None then the name of the funciton being replaced is used. [None]
         refs (str,..): The list of arguments to auto parse as references.
+        mapped ({str: str}): Arguments to map as a MappedArray when passed a file path, with the mapping mode. A set defaults to 'r'.
+        lengths ({str: str}): Arguments to fill with the element count of another argument when not passed.
+        pool (bool): Reuse per thread argument buffers for arrays, AsRef, AsPointer and refs arguments across calls,
+            buffers are keyed by argument name and array length. Not safe for re-entrant calls from callbacks. [False]
+        gil (str): 'release' to release the GIL during calls, for long running kernels, or 'hold' to keep it,
+            avoiding the release and re-acquire overhead for tiny kernels. ['release']
+        encoding (str): The encoding for str arguments hinted as ctypes.c_char_p, encoded values are cached. [utf-8]
         includes (str,..): The list of include locations, by default the python source dir is added to this list.
+        prelude (str): Common C code, such as #include lines of large shared headers, compiled once into a cached
+            precompiled header and included before the code of every function using this config. [None]
+        specialize (str,..): Arguments to compile a variant for per distinct value, int, float or bool, so
+            the C compiler can fold them as constants. Use with an optimisation option such as -O2. [()]
+        max_variants (int): The maximum number of specialized variants, other values call the generic function.
+            Variants that fail to build are not counted, up to max_variants failures. [8]
+        debug_symbols (bool): Compile with debug info and frame pointers, and write a <library>.symbols.json
+            manifest mapping the library symbols to the Python function and its source location. [False]
+        perf_map (bool): Append the library symbols, named with the Python function, to /tmp/perf-<pid>.map
+            for profilers reading perf maps. [False]
+        minimal_so (bool): Link smaller, faster loading shared objects, with hidden visibility exporting only the
+            function, unused sections removed and, unless debug_symbols is set, the symbol tables stripped. [False]
+        opt_report (bool): Collect the compiler vectorization and inlining remarks into a report, saved as
+            <library>.opt.json and available from Wrapper.opt_report. Use with -O2 or -O3. [False]
+        cpu_variants (str,.. or bool): -march levels to build each function for, best first, such as
+            ('x86-64-v4', 'x86-64-v3'). The best level supported by the CPU is loaded, falling back to the
+            baseline build. True uses the levels known for the machine. [None]
+        watch (bool): Watch the build inputs, the inline code's defining file, src files, static libs and local
+            headers, and recompile in the background when they change. Inline code is re-read from the
+            decorator in the defining file, a string literal, or an expression evaluated again in the module
+            globals. Edits to code that can not be re-read, such as names local to an enclosing function,
+            are not watched and a warning is logged. [False]
         src_files (src,..): List of additional src files
         static_libs (src,..): List of additional static library files
         shared_libs (src,..): List of additional shared library names
@@ -189,16 +684,44 @@ class CC_Config():
     compiler_opts = ('-fPIC', '-shared')
     delete_on_exit = False
     compiler = 'cc'
+    launcher = None
+    encoding = 'utf-8'
+    pool = False
+    gil = 'release'
+    watch = False
+    specialize = ()
+    max_variants = 8
+    debug_symbols = False
+    perf_map = False
+    minimal_so = False
+    opt_report = False
+    cpu_variants = None
+    cache_lock = threading.Lock()
 
     def __init__(self, **kwargs):
         self.cache_search_path = CC_Config.cache_search_path
         self.compiler_opts = CC_Config.compiler_opts
         self.delete_on_exit = CC_Config.delete_on_exit
         self.compiler = CC_Config.compiler
+        self.launcher = CC_Config.launcher
+        self.encoding = CC_Config.encoding
+        self.pool = CC_Config.pool
+        self.gil = CC_Config.gil
+        self.watch = CC_Config.watch
+        self.specialize = CC_Config.specialize
+        self.max_variants = CC_Config.max_variants
+        self.debug_symbols = CC_Config.debug_symbols
+        self.perf_map = CC_Config.perf_map
+        self.minimal_so = CC_Config.minimal_so
+        self.opt_report = CC_Config.opt_report
+        self.cpu_variants = CC_Config.cpu_variants
 
         self.function = None
         self.refs = []
+        self.mapped = {}
+        self.lengths = {}
         self.includes = []
+        self.prelude = None
         self.src_files = []
         self.static_libs = []
         self.shared_libs = []
@@ -210,24 +733,28 @@ class CC_Config():
 
     @property
     def cache(self):
-        ''' Get the cache location for compiled code.'''
+        ''' Get the cache location for compiled code, resolved once under a lock.'''
         if not self.__cache:
-            for search_path in self.cache_search_path:
-                try:
-                    os.makedirs(search_path, exist_ok=True)
-                    self.__cache = Path(search_path).absolute()
-                    logger.debug(f'Setting cache path to: {search_path}')
-                    break
-                except Exception as e:
-                    logger.debug(
-                        f'Error creating cache directory {search_path}: {e}')
-            else:
-                self.__cache = pathlib.Path(
-                    tempfile.TemporaryDirectory(prefix='loial_').name).absolute()
-                logger.debug(
-                    f'Using temporary directory for cache: {self.__cache}')
+            with CC_Config.cache_lock:
+                if not self.__cache:
+                    self.__cache = CC_Config.find_cache(self.cache_search_path)
         return self.__cache
 
+    @staticmethod
+    def find_cache(cache_search_path):
+        for search_path in cache_search_path:
+            try:
+                os.makedirs(search_path, exist_ok=True)
+                logger.debug(f'Setting cache path to: {search_path}')
+                return Path(search_path).absolute()
+            except Exception as e:
+                logger.debug(
+                    f'Error creating cache directory {search_path}: {e}')
+        cache = pathlib.Path(
+            tempfile.TemporaryDirectory(prefix='loial_').name).absolute()
+        logger.debug(f'Using temporary directory for cache: {cache}')
+        return cache
+
     @cache.setter
     def cache(self, value):
         ''' Set the cache locaion for compiled code.'''
@@ -282,11 +809,42 @@ class CC_Builder(BaseBuilder):
 
     arr_fun([1, 2, 3])
 
+    Text and byte arguments hinted as ctypes.c_char_p are passed as a const char* without copying.
+    bytes, bytearray, memoryview (including slices) and mmap storage is shared, str values are
+    encoded once and cached. A config lengths entry can pass the byte count alongside:
+
+    @cc_build('''
+    size_t count(const char *text, size_t n, char c) {
+        ...
+    }
+    ''', CC_Config(lengths={'n': 'text'}))
+    def count(text: ctypes.c_char_p, n, c: ctypes.c_char):
+        ...
+
+    count(memoryview(data)[10:20], c=b',')
+
     To define the function return type a hint should be applied in method signature:
 
         def fun2(a, b) -> ctypes.c_float:
         ...
 
+    A C_Struct return hint returns the struct by value. With a tuple or NamedTuple return hint the last
+    parameters of the C function are out pointers, filled by a generated C function returning them in
+    one struct, which is converted to the tuple:
+
+    @cc_build('''
+    void minmax(const double *a, long n, double *lo, double *hi) {
+        ...
+    }
+    ''')
+    def minmax(a: ctypes.c_double, n) -> tuple[ctypes.c_double, ctypes.c_double]:
+        ...
+
+    lo, hi = minmax([3.0, 1.0, 2.0], 3)
+
+    Without hints the argument and return types are parsed from the C prototype in the code,
+    src files or included local headers, and set on the foreign function once when it is loaded.
+
     To auto wrap a function as a C function pointer, define c types as hints:
     
         def cb(a: ctypes.c_int, b: ctypes.c_int) ->ctypes.c_float:
@@ -301,11 +859,35 @@ class CC_Builder(BaseBuilder):
             ...
 
         cbfun(1, 1, cb)
-    
+
+    The builder is not changed by calls once compiled, so functions can be called from many threads,
+    including on free-threaded interpreters. Concurrent builds of the same code compile it once.
     """
 
+    compilers = {}
+    available = {}
+    pch_lock = threading.Lock()
+    lock = threading.Lock()
+    cpu_flags = None
+    build_locks = {}
+
     def __init__(self, code, config=None):
         self.config = config if config else CC_Config()
+        if self.config.gil not in ('hold', 'release'):
+            raise ValueError(f'Unknown GIL policy: {self.config.gil}')
+        self.releases_gil = self.config.gil == 'release'
+        self.pool = threading.local() if self.config.pool else None
+        self.c_types = {}
+        self.arg_count = None
+        self.outputs = None
+        self.result = None
+        self.version = 0
+        self.variants = {} if self.config.specialize else None
+        self.specialize_index = None
+        self.opt_report = None
+        self.cpu_variant = 'baseline'
+        self.batch_function = False
+        self.role = None
         logger.debug(f"Input code:\n{code}")
         BaseBuilder.__init__(self, code, config)
 
@@ -334,107 +916,965 @@ class CC_Builder(BaseBuilder):
         return CC_Builder.cc_compile(code, output_filename, config)
 
     @staticmethod
-    def cc_compile(code, output_filename, config):
+    def find_launcher(config):
+        ''' Resolve the configured compiler launcher, 'auto' uses ccache or sccache when found on the PATH.'''
+        if config.launcher == 'auto':
+            return shutil.which('ccache') or shutil.which('sccache')
+        return config.launcher
+
+    @staticmethod
+    def cc_compile(code, output_filename, config, remarks=None, src_filename=None):
+        ''' Compile the code and config sources to output_filename.
+
+            The code is written to src_filename, by default output_filename.c removed after the build. A
+            given src_filename is kept, so builds of the same code use a stable source path in line markers,
+            __FILE__ and debug info.
+        '''
+        launcher = CC_Builder.find_launcher(config)
+        # with a launcher compile from the output directory with relative source and output paths,
+        # so launcher caches can hit wherever the cache directory is
+        cwd = os.path.dirname(os.path.abspath(output_filename)) if launcher else None
+        # launchers only cache single source compiles, so the code is compiled to an object with the
+        # launcher and linked in a second step
+        object_file = None
+        if launcher and code and '-c' not in config.compiler_opts:
+            object_file = os.path.abspath(output_filename + '.o')
+        env = None
+        stats_log = None
+        if launcher and os.path.basename(launcher).startswith('ccache'):
+            stats_log = os.path.abspath(output_filename + '.stats')
+            env = dict(os.environ, CCACHE_STATSLOG=stats_log)
+        start = time.perf_counter()
         try:
             src_file = None
             if code:
-                src_file = os.path.abspath(output_filename+'.c')
-                with open(src_file, 'w') as out:
+                src_file = os.path.abspath(src_filename or output_filename + '.c')
+                # written whole and renamed into place, another process may be compiling the same source
+                writing = f'{src_file}.{os.getpid()}.tmp'
+                with open(writing, 'w') as out:
                     out.write(code)
-            inc = [i for p in config.includes for i in ['-I', str(p)]]
+                os.replace(writing, src_file)
+            inc = [i for p in config.includes for i in [
+                '-I', os.path.abspath(p) if cwd else str(p)]]
             opts = list(config.compiler_opts)
-            cmd = [config.compiler] + inc + opts + \
-                ["-o", output_filename]
-            if src_file:
-                cmd.append(src_file)
+            path = (lambda file: os.path.relpath(file, cwd)) if cwd else (lambda file: file)
+            stderr = ''
+            if object_file:
+                cmd = [launcher, config.compiler] + inc + CC_Builder.compile_opts(opts) + \
+                    ['-c', '-o', path(object_file), path(src_file)]
+                out = subprocess.run(cmd, text=True, errors='replace', capture_output=True, check=True,
+                                     cwd=cwd, env=env)
+                stderr = out.stderr
+                # -x none so a -x language option does not read the object as source
+                cmd = [config.compiler] + inc + opts + ['-o', path(output_filename), '-x', 'none', path(object_file)]
+            else:
+                cmd = ([launcher] if launcher else []) + [config.compiler] + inc + opts + \
+                    ["-o", path(output_filename)]
+                if src_file:
+                    cmd.append(path(src_file))
             for input in config.src_files:
-                cmd.append(input)
+                cmd.append(os.path.abspath(input) if cwd else input)
             for input in config.static_libs:
-                cmd.append(input)
+                cmd.append(os.path.abspath(input) if cwd else input)
             for input in config.shared_libs:
                 cmd.append('-l'+input)
             out = subprocess.run(
-                cmd, text=True, capture_output=True, input=code, check=True)
+                cmd, text=True, errors='replace', capture_output=True, input=code, check=True, cwd=cwd,
+                env=None if object_file else env)
         except subprocess.CalledProcessError as e:
+            metrics.record('failures', time.perf_counter() - start)
             logger.error(
                 f'Error compiling code: {e.stderr}', exc_info=True)
             logger.debug(f'{"=" * 10}\n{code}')
             return None
+        except OSError as e:
+            metrics.record('failures', time.perf_counter() - start)
+            logger.error(f'Error running the compiler: {e}', exc_info=True)
+            return None
         else:
+            metrics.record(CC_Builder.launcher_result(stats_log),
+                           time.perf_counter() - start)
+            if remarks is not None:
+                remarks.append(stderr + out.stderr)
             logger.debug(
                 f'Compiled C code to: {output_filename}\n{out.stdout}')
             return output_filename
         finally:
-            if src_file:
-                os.remove(src_file)
+            for file in (None if src_filename else src_file, object_file, stats_log):
+                if file and os.path.exists(file):
+                    os.remove(file)
+
+    @staticmethod
+    def compile_opts(opts):
+        ''' The compiler options without the options only used for linking.'''
+        compile_opts = []
+        skip = False
+        for opt in opts:
+            if skip:
+                skip = False
+            elif opt == '-undefined':
+                skip = True
+            elif opt not in ('-shared', '-s', '-rdynamic') and not opt.startswith(('-Wl,', '-l', '-L')):
+                compile_opts.append(opt)
+        return compile_opts
+
+    @staticmethod
+    def compiler_available(config):
+        ''' Check once per process and PATH whether the compiler and launcher can be found.'''
+        key = (config.compiler, CC_Builder.find_launcher(config), os.environ.get('PATH'))
+        with CC_Builder.lock:
+            if key not in CC_Builder.available:
+                missing = [cmd for cmd in key[:2] if cmd and not shutil.which(cmd)]
+                if missing:
+                    logger.error(f'Compiler not found, using fallback: {missing}')
+                CC_Builder.available[key] = not missing
+            return CC_Builder.available[key]
+
+    @staticmethod
+    def build_lock(path):
+        ''' The lock serialising builds of an output file within the process.'''
+        with CC_Builder.lock:
+            return CC_Builder.build_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+    @staticmethod
+    def recipe(code, config, directory):
+        ''' Hash all inputs of a build, to remember failed builds until an input changes.'''
+        headers = cc_prototype.includes(
+            (config.prelude or '') + code, [*config.includes, directory])
+        stamps = CC_Builder.file_stamps([*config.src_files, *config.static_libs, *headers])
+        recipe = (config.prelude, code, config.compiler, config.launcher,
+                  list(config.compiler_opts), [str(i) for i in config.includes],
+                  stamps, list(config.shared_libs))
+        return hashlib.md5(repr(recipe).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def file_stamps(paths):
+        ''' The path, modification time and size of each input, None for missing inputs.'''
+        stamps = []
+        for input in paths:
+            stat = os.stat(input) if os.path.exists(input) else None
+            stamps.append((str(input), stat and (stat.st_mtime_ns, stat.st_size)))
+        return stamps
+
+    @staticmethod
+    def is_clang(compiler):
+        ''' Check once per compiler whether it is clang, which uses .pch files instead of .gch.'''
+        if compiler not in CC_Builder.compilers:
+            try:
+                out = subprocess.run([compiler, '--version'],
+                                     text=True, capture_output=True)
+                clang = 'clang' in out.stdout
+            except OSError:
+                clang = False
+            with CC_Builder.lock:
+                CC_Builder.compilers.setdefault(compiler, clang)
+        return CC_Builder.compilers[compiler]
+
+    @staticmethod
+    def with_prelude(config):
+        ''' Copy the config to include the prelude through a cached precompiled header.
+
+            The header is built once per prelude, compiler, options, include paths and version of the local
+            headers the prelude includes. If it cannot be built the prelude is included as a plain header.
+        '''
+        opts = [opt for opt in config.compiler_opts
+                if opt not in ('-shared', '-c') and not opt.startswith('-x')]
+        headers = CC_Builder.file_stamps(cc_prototype.includes(config.prelude, config.includes))
+        key = hashlib.md5(repr((config.prelude, config.compiler, opts, [
+                          str(i) for i in config.includes], headers)).encode('utf-8')).hexdigest()
+        directory = Path(config.create_cache_path('pch')) / key
+        header = directory / 'loial_prelude.h'
+        clang = CC_Builder.is_clang(config.compiler)
+        pch = Path(f'{header}.pch' if clang else f'{header}.gch')
+        with CC_Builder.pch_lock:
+            if not pch.exists():
+                os.makedirs(directory, exist_ok=True)
+                header.write_text(config.prelude)
+                pch_config = deepcopy(config)
+                pch_config.launcher = None
+                pch_config.compiler_opts = opts + ['-x', 'c-header']
+                pch_config.src_files = [str(header)]
+                pch_config.static_libs = []
+                pch_config.shared_libs = []
+                building = f'{pch}.{os.getpid()}.tmp'
+                if CC_Builder.cc_compile(None, building, pch_config):
+                    os.replace(building, pch)
+                    logger.debug(f'Built precompiled header: {pch}')
+        config = deepcopy(config)
+        if not pch.exists():
+            use = ['-include', str(header)]
+        elif clang:
+            use = ['-include-pch', str(pch)]
+        else:
+            use = ['-include', str(header), '-Winvalid-pch']
+        config.compiler_opts = [*config.compiler_opts, *use]
+        return config
+
+    @staticmethod
+    def launcher_result(stats_log):
+        ''' Classify a successful compile from the launcher stats log as a launcher hit or a real compile.'''
+        if stats_log and os.path.exists(stats_log):
+            with open(stats_log) as log:
+                if 'cache_hit' in log.read():
+                    return 'launcher_hits'
+        return 'compiles'
 
     def compile(self, fun):
         self.fun = fun
-        hash = hashlib.md5(self.code.encode('utf-8')).hexdigest()
-        prefix = 'lib'
-        ext = '.so'
-        filename = f'{prefix}{self.fun.__module__}.{self.fun.__name__}_{hash}{ext}'
-        self.so_file = self.config.create_cache_path(filename)
-        logger.debug(f'Shared object file: {self.so_file}')
-        for existing in glob.glob(f'{prefix}{self.config.cache}/{self.fun.__module__}.{self.fun.__name__}_*{ext}'):
-            if existing != self.so_file:
-                logger.debug(
-                    f'Removing existing shared object: {existing}')
-                os.remove(existing)
-
-        self.compiled = False
-        if not os.path.exists(self.so_file):
-            parent = Path(self.fun.__code__.co_filename).parent.absolute()
-            if not parent in self.config.includes:
-                self.config.includes.append(parent)
-            if CC_Builder.cc_compile(self.code, self.so_file, self.config):
-                self.compiled = True
+        self.sig = inspect.signature(fun)
+        self.outputs = CC_Builder.output_types(self.sig.return_annotation)
+        if self.variants is not None:
+            names = list(self.sig.parameters)
+            unknown = [name for name in self.config.specialize if name not in names]
+            if unknown:
+                logger.error(f'Not specializing {fun.__name__}, unknown parameters: {unknown}')
+                self.variants = None
             else:
+                self.specialize_index = [names.index(name) for name in self.config.specialize]
+        source = self.code
+        if self.outputs:
+            shim = self.output_shim()
+            if shim is None:
                 return None
+            source = self.code + shim
+        debug = '-g' if self.config.debug_symbols else ''
+        minimal = '-minimal' if self.config.minimal_so else ''
+        hash = hashlib.md5(
+            ((self.config.prelude or '') + source + debug + minimal).encode('utf-8')).hexdigest()
+        ext = f'.r{self.version}.so' if self.version else '.so'
+        stem = f'lib{self.fun.__module__}.{self.fun.__name__}{"." + self.role if self.role else ""}_'
+        if self.role != 'variant':
+            # specialized variants of different values are used together
+            self.remove_stale(stem, hash)
 
+        self.compiled = False
+        chosen = None
+        # build every variant, so a shared cache serves hosts with other CPUs, and load the best supported
+        for variant in CC_Builder.cpu_variants(self.config):
+            tag = f'.{variant}' if variant != 'baseline' else ''
+            filename = f'{stem}{hash}{tag}{ext}'
+            self.so_file = self.config.create_cache_path(filename)
+            self.cpu_variant = variant
+            logger.debug(f'Shared object file: {self.so_file}')
+            if self.ensure_built(source) and chosen is None and CC_Builder.cpu_supports(variant):
+                chosen = (self.so_file, variant)
+        if chosen is None:
+            return None
+        self.so_file, self.cpu_variant = chosen
+        if self.config.opt_report:
+            with open(f'{self.so_file}.opt.json') as report:
+                self.opt_report = json.load(report)
+
+        self.loader = ctypes.CDLL if self.releases_gil else ctypes.PyDLL
         try:
-            self.main = ctypes.LibraryLoader(
-                ctypes.CDLL).LoadLibrary(self.so_file)
-            return self
+            self.main = libraries.acquire(self.so_file, self.loader)
+            self.library_file = self.so_file
         except Exception as e:
             logger.error(
                 f'Failed to load library: {self.so_file}', exc_info=True)
             return None
+        if not self.bind():
+            self.unload()
+            return None
+        if self.config.watch:
+            self.stamps = self.input_stamps()
+        if self.config.debug_symbols or self.config.perf_map:
+            self.write_symbols()
+        return self
+
+    def remove_stale(self, stem, hash):
+        ''' Remove the libraries built from earlier code of the function, with their sources and reports,
+            unless they are loaded in this process.'''
+        library = re.compile(rf'{re.escape(stem)}[0-9a-f]{{32}}(\.[\w-]+)?(\.r\d+)?\.so')
+        extension = sysconfig.get_config_var('EXT_SUFFIX')
+        for existing in glob.glob(os.path.join(glob.escape(str(self.config.cache)), glob.escape(stem) + '*.so')):
+            name = os.path.basename(existing)
+            if (not library.fullmatch(name) or name.startswith(f'{stem}{hash}') or name.endswith(extension)
+                    or libraries.loaded(existing)):
+                continue
+            logger.debug(f'Removing existing shared object: {existing}')
+            for file in [existing, *glob.glob(glob.escape(existing) + '.*')]:
+                if not file.endswith('.tmp'):
+                    CC_Builder.remove(file)
+
+    def ensure_built(self, source):
+        ''' Build the shared object unless it is already in the cache.'''
+        with CC_Builder.build_lock(self.so_file):
+            if self.version and os.path.exists(self.so_file) and not libraries.count(self.so_file):
+                # a stale rebuild from an earlier process
+                os.remove(self.so_file)
+            stale = self.config.opt_report and not os.path.exists(f'{self.so_file}.opt.json')
+            if stale or not os.path.exists(self.so_file):
+                return self.build(source)
+            return True
 
-    def __call__(self, *args, **kwargs):
+    @staticmethod
+    def cpu_variants(config):
+        ''' The CPU variants to build, best first, ending with the baseline.'''
+        variants = config.cpu_variants
+        if variants is True:
+            variants = CPU_VARIANTS.get(platform.machine().lower(), ())
+        return [*(variant for variant in variants or () if variant != 'baseline'), 'baseline']
+
+    @staticmethod
+    def cpu_supports(variant):
+        ''' Check whether the CPU has the features of a variant, from /proc/cpuinfo.'''
+        if variant == 'baseline':
+            return True
+        if CC_Builder.cpu_flags is None:
+            flags = set()
+            try:
+                with open('/proc/cpuinfo') as cpuinfo:
+                    for line in cpuinfo:
+                        if line.startswith(('flags', 'Features')):
+                            flags = set(line.split(':', 1)[1].split())
+                            break
+            except OSError:
+                logger.debug('CPU features unknown, using the baseline', exc_info=True)
+            CC_Builder.cpu_flags = flags
+        required = CPU_FEATURES.get(variant)
+        return required is not None and required <= CC_Builder.cpu_flags
+
+    def symbols(self):
+        ''' The defined functions of the shared object as (name, offset, size), from nm when available.'''
+        nm = shutil.which('nm')
+        # a stripped library only has its dynamic symbols
+        for table in ([], ['-D']) if nm else ():
+            out = subprocess.run([nm, *table, '-S', '--defined-only', self.library_file],
+                                 text=True, capture_output=True)
+            symbols = []
+            for line in out.stdout.splitlines():
+                parts = line.split()
+                if len(parts) == 4 and parts[2] in 'tT':
+                    symbols.append((parts[3], int(parts[0], 16), int(parts[1], 16)))
+            if symbols:
+                return symbols
+        return [(self.function.__name__, None, 0)]
+
+    def manifest(self):
+        ''' Map the loaded library and its symbols back to the decorated Python function.
+
+            Returns:
+                dict: The library, the Python function and its source location, the load base address
+                and the symbols with their offsets, addresses and sizes.
+        '''
+        address = ctypes.cast(self.function, ctypes.c_void_p).value
+        symbols = self.symbols()
+        offset = dict((name, offset) for name, offset, _ in symbols).get(self.function.__name__)
+        base = address - offset if offset is not None else None
+        entries = []
+        for name, offset, size in symbols:
+            entry = address if offset is None else base + offset
+            entries.append({'name': name, 'offset': offset, 'size': size, 'address': entry})
+        return {
+            'library': self.library_file,
+            'function': self.function.__name__,
+            'python': f'{self.fun.__module__}.{self.fun.__qualname__}',
+            'source': f'{self.fun.__code__.co_filename}:{self.fun.__code__.co_firstlineno}',
+            'base': base,
+            'symbols': entries,
+        }
+
+    def write_symbols(self):
+        ''' Write the symbol manifest next to the shared object, and append the symbols to the perf map
+            of the process when perf_map is set.'''
+        manifest = self.manifest()
+        try:
+            with open(f'{self.library_file}.symbols.json', 'w') as out:
+                json.dump(manifest, out, indent=2)
+            if self.config.perf_map:
+                lines = [f'{symbol["address"]:x} {symbol["size"]:x} {symbol["name"]} '
+                         f'[{manifest["python"]} {manifest["source"]}]\n'
+                         for symbol in manifest['symbols']]
+                with CC_Builder.lock, open(f'/tmp/perf-{os.getpid()}.map', 'a') as out:
+                    out.writelines(lines)
+        except OSError:
+            logger.error(f'Failed to write symbols of: {self.library_file}', exc_info=True)
+
+    def build(self, source):
+        ''' Compile the shared object, to a temporary file renamed into place so it is never loaded
+            part written.'''
+        config = deepcopy(self.config)
+        parent = Path(self.fun.__code__.co_filename).parent.absolute()
+        if parent not in config.includes:
+            config.includes = [*config.includes, parent]
+        if config.debug_symbols:
+            config.compiler_opts = [*config.compiler_opts, '-g', '-fno-omit-frame-pointer']
+        if self.cpu_variant != 'baseline':
+            config.compiler_opts = [*config.compiler_opts, f'-march={self.cpu_variant}']
+        remarks = [] if config.opt_report else None
+        if config.opt_report:
+            config.compiler_opts = [*config.compiler_opts,
+                                    *cc_remarks.flags(CC_Builder.is_clang(config.compiler))]
+        failed = f'{self.so_file}.{CC_Builder.recipe(self.code, self.config, parent)}.failed'
+        if os.path.exists(failed):
+            logger.info(
+                f'Skipping build that failed before with the same inputs: {failed}')
+            return False
+        if not CC_Builder.compiler_available(config):
+            return False
+        if config.prelude:
+            config = CC_Builder.with_prelude(config)
+        building = f'{self.so_file}.{os.getpid()}.tmp'
+        if config.minimal_so:
+            source = self.minimize(source, config, building)
+        try:
+            if not CC_Builder.cc_compile(source, building, config, remarks, f'{self.so_file}.c'):
+                Path(failed).touch()
+                return False
+        finally:
+            if os.path.exists(f'{building}.map'):
+                os.remove(f'{building}.map')
+        if remarks:
+            report = cc_remarks.parse(remarks[0], f'{self.so_file}.c')
+            with open(f'{self.so_file}.opt.json', 'w') as out:
+                json.dump(report, out, indent=2)
+        os.replace(building, self.so_file)
+        self.compiled = True
+        return True
+
+    def exports(self):
+        ''' The symbols the library is loaded through.'''
+        fun_name = self.config.function if self.config.function else self.fun.__name__
+        return [f'loial_call_{fun_name}' if self.outputs else fun_name]
+
+    def minimize(self, source, config, building):
+        ''' Add the options linking a minimal shared object to config, exporting only the library's entry
+            points, and return the source with the entry points declared visible.'''
+        exports = self.exports()
+        opts = ['-ffunction-sections', '-fdata-sections']
+        if source:
+            # src files are compiled with the same options, only the inline code declares its exports visible
+            opts.append('-fvisibility=hidden')
+            source += ''.join(f'\nextern __typeof__({name}) {name} __attribute__((visibility("default")));'
+                              for name in exports) + '\n'
+        if sys.platform == 'darwin':
+            opts += ['-Wl,-dead_strip', *(f'-Wl,-exported_symbol,_{name}' for name in exports)]
+            if not config.debug_symbols:
+                opts.append('-Wl,-x')
+        else:
+            with open(f'{building}.map', 'w') as script:
+                script.write(f'{{ global: {"; ".join(exports)}; local: *; }};\n')
+            opts += ['-Wl,--gc-sections', f'-Wl,--version-script={os.path.abspath(building)}.map']
+            if not config.debug_symbols:
+                opts.append('-s')
+        config.compiler_opts = [*config.compiler_opts, *opts]
+        return source
+
+    def attach(self, wrapper):
+        if self.config.watch:
+            if self.code and self.defined_code() is None:
+                logger.warning(f'Unable to re-read the inline code of {self.fun.__name__}, edits are not watched')
+            watcher.watch(wrapper)
+
+    def inputs(self):
+        ''' The files a rebuild depends on: the inline code's defining file, src files, static libs and local headers.'''
+        inputs = [self.fun.__code__.co_filename] if self.code else []
+        inputs += [*self.config.src_files, *self.config.static_libs]
+        include_dirs = [*self.config.includes,
+                        Path(self.fun.__code__.co_filename).parent.absolute()]
+        texts = [text for text in (self.config.prelude, self.code) if text]
+        for src in self.config.src_files:
+            if Path(src).suffix in ('.c', '.h') and os.path.isfile(src):
+                with open(src) as file:
+                    texts.append(file.read())
+        seen = set()
+        for text in texts:
+            inputs += cc_prototype.includes(text, include_dirs, seen)
+        return [str(input) for input in inputs]
+
+    def input_stamps(self):
+        stamps = {}
+        for input in self.inputs():
+            stat = os.stat(input) if os.path.exists(input) else None
+            stamps[input] = stat and (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    def changed(self):
+        ''' Check whether any build input changed since it was compiled.'''
+        return self.input_stamps() != self.stamps
+
+    def defined_code(self):
+        ''' Re-read the inline code from the decorator in the defining file, None if it cannot be found.
+
+            A string literal is read as is. Other expressions, such as Record.define() + a string or
+            f-strings, are evaluated again in the module globals.
+        '''
+        filename = self.fun.__code__.co_filename
+        try:
+            with open(filename) as file:
+                tree = ast.parse(file.read())
+        except (OSError, SyntaxError):
+            return None
+        for node in ast.walk(tree):
+            if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) or node.name != self.fun.__name__:
+                continue
+            for decorator in node.decorator_list:
+                if not isinstance(decorator, ast.Call):
+                    continue
+                args = [*decorator.args[:1], *(k.value for k in decorator.keywords if k.arg == 'code')]
+                for arg in args:
+                    if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+                        return arg.value
+                    try:
+                        code = eval(compile(ast.Expression(arg), filename, 'eval'), self.fun.__globals__)
+                    except Exception:
+                        logger.debug(f'Unable to evaluate the inline code of: {self.fun.__name__}', exc_info=True)
+                        return None
+                    return code if isinstance(code, str) else None
+        return None
+
+    def reload(self):
+        ''' Rebuild the function from its current inputs under the next version.
+
+            Returns:
+                CC_Builder: The rebuilt builder, None when nothing relevant changed or the build failed.
+        '''
+        stamps, self.stamps = self.stamps, self.input_stamps()
+        code = self.code
+        if self.code:
+            code = self.defined_code()
+            if code is None:
+                logger.warning(f'Unable to re-read the inline code of {self.fun.__name__}, edits are not watched')
+                code = self.code
+            defining = self.fun.__code__.co_filename
+            changed = {input for input in self.stamps if self.stamps[input] != stamps.get(input)}
+            if code == self.code and changed <= {defining}:
+                return None
+        logger.info(f'Rebuilding changed function: {self.fun.__name__}')
+        builder = CC_Builder(code, self.config)
+        builder.version = self.version + 1
+        rebuilt = builder.compile(self.fun)
+        if not rebuilt:
+            logger.error(f'Rebuild failed, keeping version {self.version} of: {self.fun.__name__}')
+        return rebuilt
+
+    def bind(self):
+        ''' Resolve the foreign function and set its ctypes signature once.
+
+            The return type comes from the return hint, otherwise it and the argument types are parsed
+            from the C prototype, so ctypes converts arguments in C. If any parameter type cannot be
+            mapped the argument types are left unset.
+        '''
+        self.fun_name = self.config.function if self.config.function else self.fun.__name__
+        symbol = f'loial_call_{self.fun_name}' if self.outputs else self.fun_name
+        try:
+            # a new function pointer, the library is shared with other builders
+            self.function = self.main[symbol]
+        except AttributeError:
+            logger.error(f'Function not found in library: {symbol}')
+            return None
+        signature = cc_prototype.c_signature(
+            self.sources(), self.fun_name, self.known_types())
+        logger.debug(f'Parsed C signature of {self.fun_name}: {signature}')
+        if self.outputs:
+            names, types, self.result = self.outputs
+            self.function.restype = type(f'{self.fun_name}_result', (ctypes.Structure,),
+                                         {'_fields_': list(zip(names, types))})
+            # the shim takes the parameters before the out pointers
+            signature = (self.function.restype,
+                         signature[1] and signature[1][:-len(types)])
+        elif self.sig.return_annotation != inspect._empty:
+            self.function.restype = self.sig.return_annotation
+        elif signature:
+            self.function.restype = signature[0]
+        if signature and signature[1] is not None:
+            self.function.argtypes = signature[1]
+            self.c_types = dict(zip(self.sig.parameters, signature[1]))
+            # python parameters beyond the C prototype are not passed
+            self.arg_count = len(signature[1])
+        return self
+
+    def sources(self):
+        ''' Yield the C sources that may declare the function.'''
+        return cc_prototype.sources(self.code, self.config, Path(self.fun.__code__.co_filename).parent.absolute())
+
+    @staticmethod
+    def output_types(annotation):
+        ''' The field names, ctypes types and result conversion of a tuple or NamedTuple return hint,
+            None for other hints.'''
+        if typing.get_origin(annotation) is tuple:
+            types = list(typing.get_args(annotation))
+            names = [f'f{i}' for i in range(len(types))]
+            getter = operator.attrgetter(*names)
+            return names, types, getter if len(names) > 1 else lambda result: (getter(result),)
+        if isinstance(annotation, type) and issubclass(annotation, tuple) and hasattr(annotation, '_fields'):
+            names = list(annotation._fields)
+            types = [annotation.__annotations__[name] for name in names]
+            getter = operator.attrgetter(*names)
+            if len(names) == 1:
+                return names, types, lambda result: annotation(getter(result))
+            return names, types, lambda result: annotation._make(getter(result))
+        return None
+
+    def output_shim(self):
+        ''' Generate a C function calling the function with out pointers to the fields of a returned struct.
+
+            For a tuple or NamedTuple return hint the last parameters of the C function are taken as
+            pointers to the outputs.
+        '''
         fun_name = self.config.function if self.config.function else self.fun.__name__
+        names, types, _ = self.outputs
+        for source in self.sources():
+            prototype = cc_prototype.find_prototype(source, fun_name)
+            if prototype:
+                break
+        else:
+            logger.error(f'No prototype for the outputs of: {fun_name}')
+            return None
+        head, params = prototype
+        inputs, outputs = params[:len(params) - len(names)], params[len(params) - len(names):]
+        # the members are the pointed to types, without the qualifiers of the out pointers
+        fields = [' '.join(word for word in output.replace('*', ' ', 1).split()
+                           if word not in ('const', 'volatile', 'restrict', '__restrict', '__restrict__'))
+                  for output in outputs]
+        input_names = [cc_prototype.param_name(param) for param in inputs]
+        try:
+            field_types = [cc_prototype.c_type(field, self.known_types()) for field in fields]
+        except cc_prototype.Unsupported:
+            field_types = None
+        if (len(outputs) != len(names) or None in input_names or field_types != types
+                or not all('*' in output for output in outputs)):
+            logger.error(f'The last parameters of {fun_name} do not match the outputs: {types}')
+            return None
+        field_names = [cc_prototype.param_name(field) for field in fields]
+        members = ''.join(f' {field};' for field in fields)
+        args = ', '.join([*input_names, *(f'&loial_result.{name}' for name in field_names)])
+        return f'''
+{head} {fun_name}({', '.join(params)});
+struct loial_result_{fun_name} {{{members} }};
+struct loial_result_{fun_name} loial_call_{fun_name}({', '.join(inputs) or 'void'}) {{
+    struct loial_result_{fun_name} loial_result;
+    {fun_name}({args});
+    return loial_result;
+}}
+'''
+
+    def known_types(self):
+        ''' Map struct names used in the signature hints to their types.'''
+        return known_types(self.sig)
+
+    def element_type(self, name):
+        ''' The hinted type of an argument, or the element type parsed from the C prototype.'''
+        c_type = self.annotation(self.sig, name)
+        if c_type is None:
+            c_type = self.c_types.get(name)
+            if isinstance(c_type, type) and issubclass(c_type, ctypes._Pointer):
+                c_type = c_type._type_
+        return c_type
+
+    def __call__(self, *args, **kwargs):
+        if self.variants is not None:
+            variant = self.variant(args, kwargs)
+            if variant is not None:
+                return variant(*args, **kwargs)
         all_args = self.build_args(*args, **kwargs)
-        logger.debug(f'Calling function: {fun_name} with args: {all_args}')
-        fun = getattr(self.main, fun_name)
-        sig = inspect.signature(self.fun)
-        if sig.return_annotation != inspect._empty:
-            fun.restype = sig.return_annotation
-        rtn = fun(*tuple(all_args))
+        logger.debug(f'Calling function: {self.fun_name} with args: {all_args}')
+        rtn = self.function(*all_args[:self.arg_count])
         for i, arg in enumerate(args):
             if isinstance(arg, AsPointer):
                 arg.value = all_args[i].contents.value
-        return rtn
+        return rtn if self.result is None else self.result(rtn)
+
+    def variant(self, args, kwargs):
+        ''' The builder specialized for the values of the config specialize arguments, compiled on first use.
+
+            Returns None, calling the generic function, when a value is not an int, float or bool, a float
+            is not finite, the variant failed to build or max_variants variants exist.
+        '''
+        index = self.specialize_index
+        if not kwargs and len(args) > max(index):
+            key = tuple(args[i] for i in index)
+        else:
+            bound = self.sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = tuple(bound.arguments[name] for name in self.config.specialize)
+        if not all(type(value) in (int, bool) or type(value) is float and math.isfinite(value)
+                   for value in key):
+            return None
+        key = tuple((type(value), value) for value in key)
+        if key in self.variants:
+            return self.variants[key]
+        with CC_Builder.build_lock(self.library_file):
+            if key not in self.variants:
+                built = sum(variant is not None for variant in self.variants.values())
+                # failed variants are remembered, so they are not rebuilt, and limited separately
+                if built >= self.config.max_variants or len(self.variants) - built >= self.config.max_variants:
+                    return None
+                self.variants[key] = self.specialize(dict(zip(self.config.specialize, key)))
+        return self.variants[key]
+
+    def specialize(self, values):
+        ''' Compile a variant calling the function with constant values for some arguments.
+
+            The variant is a C function taking the same parameters, flattened so the function is
+            inlined into it and the constants can be folded. A plain declaration precedes it, so the
+            prototype gives its argument and result types. The values are also defined as
+            LOIAL_<name> macros, with LOIAL_SPECIALIZED, for the code to test.
+        '''
+        prototype = self.prototype(self.fun_name)
+        names = [cc_prototype.param_name(param) for param in prototype[1]] if prototype else [None]
+        if None in names or not all(name in names for name in values):
+            logger.error(f'Unable to specialize the parameters of: {self.fun_name}')
+            return None
+        head = ' '.join(word for word in prototype[0].split() if word not in ('static', 'inline', 'extern'))
+        literals = {name: str(int(value)) if kind is bool else repr(value)
+                    for name, (kind, value) in values.items()}
+        defines = ''.join(f'#define LOIAL_{name} {literal}\n' for name, literal in literals.items())
+        call = f'{self.fun_name}({", ".join(literals.get(name, name) for name in names)})'
+        variant_name = f'loial_variant_{self.fun_name}'
+        code = f'''#define LOIAL_SPECIALIZED 1
+{defines}{self.code}
+{prototype[0]} {self.fun_name}({', '.join(prototype[1])});
+{head} {variant_name}({', '.join(prototype[1])});
+__attribute__((flatten)) {head} {variant_name}({', '.join(prototype[1])}) {{
+    {'' if head == 'void' else 'return '}{call};
+}}
+'''
+        config = copy(self.config)
+        config.function = variant_name
+        config.specialize = ()
+        config.watch = False
+        logger.debug(f'Specializing {self.fun_name} for: {literals}')
+        builder = CC_Builder(code, config)
+        builder.role = 'variant'
+        return builder.compile(self.fun)
+
+    def prototype(self, fun_name):
+        ''' The return declaration and parameter declarations of a function in the sources, or None.'''
+        for source in self.sources():
+            prototype = cc_prototype.find_prototype(source, fun_name)
+            if prototype:
+                return prototype
+        return None
+
+    def batch(self):
+        ''' The foreign function of a generated batch entry point, calling the function for each element
+            of argument arrays and storing the results, compiled on first use.
+
+            Returns None when an argument or the result is not a scalar, or the build fails.
+        '''
+        with CC_Builder.build_lock(self.library_file):
+            if self.batch_function is not False:
+                return self.batch_function
+            self.batch_function = None
+            argtypes, restype = self.function.argtypes, self.function.restype
+            prototype = self.prototype(self.fun_name)
+            scalars = [*(argtypes or ()), *([restype] if restype else [])]
+            if (not prototype or argtypes is None or self.result is not None
+                    or not all(t in cc_prototype.C_NAMES and t is not ctypes.c_char for t in scalars)):
+                logger.info(f'Not batching {self.fun_name}, the arguments or result are not scalars')
+                return None
+            name = f'loial_batch_{self.fun_name}'
+            params = ['long loial_n', *(f'const {cc_prototype.C_NAMES[t]} *loial_a{i}'
+                                        for i, t in enumerate(argtypes))]
+            call = f'{self.fun_name}({", ".join(f"loial_a{i}[loial_i]" for i in range(len(argtypes)))})'
+            if restype:
+                params.append(f'{cc_prototype.C_NAMES[restype]} *loial_out')
+                call = f'loial_out[loial_i] = {call}'
+            code = f'''{self.code}
+{prototype[0]} {self.fun_name}({', '.join(prototype[1])});
+void {name}({', '.join(params)}) {{
+    for (long loial_i = 0; loial_i < loial_n; loial_i++)
+        {call};
+}}
+'''
+            config = copy(self.config)
+            config.function = name
+            config.specialize = ()
+            config.watch = False
+            # the batch entry point is called directly, without Python parameters
+            fun = types.FunctionType(self.fun.__code__, self.fun.__globals__, self.fun.__name__)
+            fun.__module__ = self.fun.__module__
+            fun.__signature__ = inspect.Signature()
+            builder = CC_Builder(code, config)
+            builder.role = 'batch'
+            builder = builder.compile(fun)
+            if builder:
+                self.batch_builder = builder
+                self.batch_function = builder.function
+            return self.batch_function
+
+    def stream(self, iterable, chunk_size=1024, double_buffer=False):
+        ''' Call the function for each argument tuple of an iterable, yielding the results lazily.
+
+            Arguments are packed chunk by chunk into reusable typed arrays passed to a generated batch
+            entry point. With double_buffer the next chunk is packed in a background thread while the
+            current chunk is processed. Functions without a batch entry point are called per item.
+        '''
+        batch = self.batch()
+        if batch is None:
+            for item in iterable:
+                yield self(*(item if isinstance(item, tuple) else (item,)))
+            return
+        buffers = [self.stream_buffers(chunk_size) for _ in range(2 if double_buffer else 1)]
+        if double_buffer:
+            packed = self.pack_behind(iterable, chunk_size, buffers)
+        else:
+            packed = ((buffers[0], self.fill(buffers[0], chunk))
+                      for chunk in self.chunks(iterable, chunk_size))
+        for (arrays, out), count in packed:
+            batch(count, *arrays, *([out] if out is not None else []))
+            yield from out[:count] if out is not None else [None] * count
+
+    def stream_buffers(self, chunk_size):
+        restype = self.function.restype
+        arrays = [(t * chunk_size)() for t in self.function.argtypes]
+        return arrays, (restype * chunk_size)() if restype else None
+
+    def chunks(self, iterable, chunk_size):
+        ''' Yield lists of up to chunk_size argument tuples, with defaults applied to short tuples.'''
+        items = iter(iterable)
+        arg_count = len(self.function.argtypes)
+        while chunk := [item if isinstance(item, tuple) else (item,)
+                        for item in itertools.islice(items, chunk_size)]:
+            for position, item in enumerate(chunk):
+                if len(item) != arg_count:
+                    bound = self.sig.bind(*item)
+                    bound.apply_defaults()
+                    chunk[position] = bound.args[:arg_count]
+            yield chunk
+
+    @staticmethod
+    def fill(buffer, chunk):
+        ''' Copy the argument columns of a chunk into the buffer arrays, returning the item count.'''
+        for array, column in zip(buffer[0], zip(*chunk)):
+            array[:len(chunk)] = column
+        return len(chunk)
+
+    def pack_behind(self, iterable, chunk_size, buffers):
+        ''' Yield packed buffers and their item counts, packing the next chunk in a background thread
+            while the consumer processes the current one.'''
+        ready = queue.Queue()
+        free = queue.Queue()
+        for buffer in buffers:
+            free.put(buffer)
+
+        def producer():
+            try:
+                for chunk in self.chunks(iterable, chunk_size):
+                    buffer = free.get()
+                    if buffer is None:
+                        return
+                    ready.put((buffer, CC_Builder.fill(buffer, chunk), None))
+            except BaseException as e:
+                ready.put((None, 0, e))
+            else:
+                ready.put((None, 0, None))
+
+        thread = threading.Thread(target=producer, name='loial-stream', daemon=True)
+        thread.start()
+        try:
+            while True:
+                buffer, count, error = ready.get()
+                if error is not None:
+                    raise error
+                if buffer is None:
+                    return
+                yield buffer, count
+                free.put(buffer)
+        finally:
+            # unblock the producer when the consumer stops early
+            free.put(None)
 
     def build_args(self, *args, **kwargs):
-        sig = inspect.signature(self.fun)
+        values = self.bind_args(*args, **kwargs)
+        return [self.type_arg(values[name], self.sig, name) for name in self.sig.parameters]
+
+    def bind_args(self, *args, **kwargs):
+        ''' Bind the arguments to the parameter names, adding defaults, mapped files and lengths.'''
+        sig = self.sig
         param_names = list(sig.parameters.keys())
-        all_args = []
-        for i, name in enumerate(param_names[:len(args)]):
-            all_args.append(self.type_arg(args[i], sig, name))
-        for i, name in enumerate(param_names[len(args):]):
+        values = dict(zip(param_names, args))
+        for name in param_names[len(args):]:
             if name in kwargs:
-                all_args.append(self.type_arg(kwargs.get(name), sig, name))
-            else:
+                values[name] = kwargs.get(name)
+            elif name not in self.config.lengths:
                 default = sig.parameters[name].default
                 if default is inspect.Parameter.empty:
                     raise ValueError(f'Missing required argument: {name}')
-                all_args.append(self.type_arg(default, sig, name))
-        return (all_args)
+                values[name] = default
+        for name in param_names:
+            if name in self.config.mapped and isinstance(values.get(name), (str, os.PathLike)):
+                mode = self.config.mapped[name] if isinstance(
+                    self.config.mapped, dict) else 'r'
+                values[name] = MappedArray(
+                    values[name], self.element_type(name), mode)
+        for name, source in self.config.lengths.items():
+            if name not in values:
+                values[name] = self.arg_length(
+                    values[source], self.element_type(source))
+        return values
+
+    def pool_map(self, args, chunksize=1):
+        ''' Call the function for each argument tuple in a pool of worker processes.
+
+            The workers load the same cached shared object. SharedArray arguments are passed by the
+            name of their shared memory block, other arguments are pickled.
+
+            Args:
+                args (iterable): Argument tuples, or single arguments, for each call.
+                chunksize (int): The number of calls sent to a worker at a time. [1]
+
+            Returns:
+                list: The results in the order of the arguments.
+        '''
+        from .cc_pool import pool, type_spec
+        if self.result is not None:
+            raise TypeError('Tuple returns can not be passed from pool processes')
+        names = list(self.sig.parameters)[:self.arg_count]
+        argtypes = self.function.argtypes
+        spec = (self.library_file, self.fun_name, self.releases_gil, type_spec(self.function.restype),
+                tuple(map(type_spec, argtypes)) if argtypes is not None else None,
+                tuple(CC_Builder.annotation(self.sig, name) for name in names))
+        tasks = []
+        for item in args:
+            values = self.bind_args(*(item if isinstance(item, tuple) else (item,)))
+            task = tuple(values[name] for name in names)
+            for arg in task:
+                if isinstance(arg, (AsRef, AsPointer, MappedArray, mmap.mmap, ctypes._Pointer)):
+                    raise TypeError(f'{type(arg).__name__} arguments can not be passed to pool processes')
+            tasks.append(task)
+        return pool.map(spec, tasks, chunksize)
+
+    @staticmethod
+    def annotation(sig, name):
+        annotation = sig.parameters[name].annotation
+        return None if annotation is inspect.Parameter.empty else annotation
+
+    def arg_length(self, arg, c_type):
+        ''' The element count of an argument passed as an array, or the byte count of text and buffers.'''
+        arg = arg.value if isinstance(arg, (AsPointer, AsRef)) else arg
+        if isinstance(arg, str) and c_type is ctypes.c_char_p:
+            return len(_encode(arg, self.config.encoding))
+        if isinstance(arg, memoryview):
+            return arg.nbytes
+        if isinstance(arg, MappedArray):
+            return arg.count(c_type)
+        if isinstance(arg, mmap.mmap):
+            return len(arg) // (ctypes.sizeof(c_type) if c_type else 1)
+        return len(arg)
 
     def type_arg(self, arg, sig, name):
         param = sig.parameters[name]
         annotation = param.annotation
-        if isinstance(arg, list):
+        if isinstance(arg, ctypes.Array):
+            val = arg
+        elif self.element_type(name) is ctypes.c_char_p and isinstance(arg, (str, bytes, bytearray, memoryview, mmap.mmap)):
+            val = self.char_pointer(arg)
+        elif isinstance(arg, (MappedArray, mmap.mmap)):
+            mapped = arg if isinstance(arg, MappedArray) else MappedArray(arg)
+            val = mapped.pointer(self.element_type(name))
+        elif isinstance(arg, list) and arg and isinstance(arg[0], ctypes.Structure):
+            struct = annotation if annotation is not inspect.Parameter.empty else type(arg[0])
+            val = (struct * len(arg))(*arg)
+        elif isinstance(arg, list) and self.pool is not None and self.is_simple(annotation):
+            val = self.pooled((name, len(arg)), lambda: (annotation * len(arg))())
+            try:
+                val[:] = arg
+            except TypeError:
+                val = (annotation * len(arg))(*tuple([self.type_arg(v, sig, name) for v in arg]))
+        elif isinstance(arg, list):
             arr = annotation * len(arg)
             val = arr(*tuple([self.type_arg(v, sig, name) for v in arg]))
         elif inspect.isfunction(arg):
@@ -448,7 +1888,13 @@ class CC_Builder(BaseBuilder):
         else:
             val = arg.value if isinstance(arg, AsPointer) else arg
             if annotation is inspect.Parameter.empty:
-                val = val                
+                val = val
+            elif self.pool is not None and self.is_simple(annotation) and (
+                    isinstance(arg, (AsRef, AsPointer)) or name in self.config.refs):
+                scalar, pointer = self.pooled(
+                    name, lambda: CC_Builder.scalar_pointer(annotation))
+                scalar.value = val.value if isinstance(val, AsRef) else val
+                return pointer
             else:
                 if isinstance(val, AsRef):
                     val = ctypes.byref(annotation(val.value))
@@ -462,17 +1908,62 @@ class CC_Builder(BaseBuilder):
 
         return val
 
-    def clean(self):
-        ''' Clean up the compiled shared object file.'''
+    @staticmethod
+    def is_simple(annotation):
+        return isinstance(annotation, type) and issubclass(annotation, ctypes._SimpleCData)
+
+    @staticmethod
+    def scalar_pointer(c_type):
+        scalar = c_type()
+        return scalar, ctypes.pointer(scalar)
+
+    def pooled(self, key, create):
+        ''' Get the reusable argument buffer for this thread, creating it on first use.'''
+        buffers = self.pool.__dict__
+        buffer = buffers.get(key)
+        if buffer is None:
+            buffer = buffers[key] = create()
+        return buffer
+
+    def char_pointer(self, arg):
+        ''' Pass text or byte storage as a char pointer, sharing the existing storage where possible.'''
+        if isinstance(arg, str):
+            return ctypes.c_char_p(_encode(arg, self.config.encoding))
+        if isinstance(arg, bytes):
+            return ctypes.c_char_p(arg)
+        return buffer_pointer(arg)
+
+    @staticmethod
+    def remove(path):
+        ''' Remove a compiled file, if it exists.'''
         try:
-            if self.so_file and os.path.exists(self.so_file):
-                logger.debug(f"Removing file: {self.so_file}")
-                os.remove(self.so_file)
+            if path and os.path.exists(path):
+                logger.debug(f"Removing file: {path}")
+                os.remove(path)
         except OSError as e:
-            logger.debug(f"Error removing file: {self.so_file}", exc_info=True)
+            logger.debug(f"Error removing file: {path}", exc_info=True)
+
+    def clean(self):
+        ''' Clean up the compiled shared object file.'''
+        CC_Builder.remove(self.so_file)
+        CC_Builder.remove(self.so_file and f'{self.so_file}.c')
         self.so_file = None
 
+    def unload(self):
+        ''' Release the shared library, it is closed when no other builder uses it.
+            Calling the function after unloading raises a RuntimeError.'''
+        main = getattr(self, 'main', None)
+        if main is not None:
+            self.main = None
+            self.function = CC_Builder.unloaded
+            libraries.release(self.library_file, self.loader)
+
+    @staticmethod
+    def unloaded(*args):
+        raise RuntimeError('Shared library has been unloaded')
+
     def __del__(self):
-        ''' Destructor to clean up the compiled shared object file.'''
+        ''' Destructor to unload the library and clean up the compiled shared object file.'''
+        self.unload()
         if self.config.delete_on_exit:
             self.clean()
@@ -0,0 +1,194 @@
+import ctypes
+import functools
+import inspect
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+logger = logging.getLogger(__name__)
+
+
+def type_spec(c_type):
+    ''' A picklable description of a ctypes type, pointer types are not picklable.'''
+    if isinstance(c_type, type) and issubclass(c_type, ctypes._Pointer):
+        return ('pointer', type_spec(c_type._type_))
+    return c_type
+
+
+def from_spec(spec):
+    if isinstance(spec, tuple):
+        return ctypes.POINTER(from_spec(spec[1]))
+    return spec
+
+
+class SharedArray():
+    """ A ctypes array in a multiprocessing.shared_memory block, passed to pool_map workers by name
+    instead of being pickled, so inputs are not copied and outputs written by the workers are seen by
+    the caller:
+
+        values = SharedArray(ctypes.c_double, range(1000))
+        out = SharedArray(ctypes.c_double, length=10)
+        fun.pool_map((values, i * 100, 100, out, i) for i in range(10))
+
+    The creator owns the block, close releases it and unlinks it.
+    """
+
+    def __init__(self, c_type, values=None, length=None, name=None):
+        if values is not None:
+            values = list(values)
+            length = len(values)
+        self.c_type = c_type
+        self.length = length
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(
+                create=True, size=max(ctypes.sizeof(c_type) * length, 1))
+        elif sys.version_info >= (3, 13):
+            self.memory = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            # attaching registers the block again with the parent's resource tracker, which is harmless
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.array = (c_type * length).from_buffer(self.memory.buf)
+        if values is not None:
+            self.array[:] = values
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def __reduce__(self):
+        return (SharedArray.attach, (self.name, type_spec(self.c_type), self.length))
+
+    @staticmethod
+    def attach(name, spec, length):
+        return SharedArray(from_spec(spec), length=length, name=name)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        return self.array[index]
+
+    def __setitem__(self, index, value):
+        self.array[index] = value
+
+    def __iter__(self):
+        return iter(self.array)
+
+    def close(self):
+        ''' Release the mapping, unlinking the block when this process created it.'''
+        if self.array is None:
+            return
+        self.array = None
+        try:
+            self.memory.close()
+        except BufferError:
+            # ctypes objects still refer to the mapping, it is released with them
+            logger.debug(f'Shared array still in use: {self.name}')
+        if self.owner:
+            self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        if getattr(self, 'array', None) is not None:
+            self.close()
+
+
+functions = {}
+
+
+def load(spec):
+    ''' Load the foreign function of a spec once per worker process.'''
+    function = functions.get(spec)
+    if function is None:
+        so_file, fun_name, releases_gil, restype, argtypes, _ = spec
+        loader = ctypes.CDLL if releases_gil else ctypes.PyDLL
+        function = loader(so_file)[fun_name]
+        function.restype = from_spec(restype)
+        if argtypes is not None:
+            function.argtypes = [from_spec(a) for a in argtypes]
+        functions[spec] = function
+    return function
+
+
+def worker_arg(arg, hint, argtype):
+    if isinstance(arg, SharedArray):
+        return arg.array
+    if isinstance(arg, list):
+        element = hint if hint is not None else argtype._type_
+        return (element * len(arg))(*arg)
+    if isinstance(arg, str):
+        return arg.encode('utf-8')
+    if inspect.isfunction(arg):
+        sig = inspect.signature(arg)
+        restype = sig.return_annotation if sig.return_annotation is not inspect.Parameter.empty else None
+        return ctypes.CFUNCTYPE(restype, *[p.annotation for p in sig.parameters.values()])(arg)
+    if hint is not None and argtype is None:
+        return hint(arg)
+    return arg
+
+
+def call(spec, args):
+    ''' Run one call in a worker process.'''
+    function = load(spec)
+    hints = spec[5]
+    argtypes = spec[4] or [None] * len(args)
+    values = [worker_arg(arg, hint, from_spec(argtype))
+              for arg, hint, argtype in zip(args, hints, argtypes)]
+    try:
+        return function(*values)
+    finally:
+        del values
+        for arg in args:
+            if isinstance(arg, SharedArray):
+                arg.close()
+
+
+def warm(_):
+    return os.getpid()
+
+
+class CC_Pool():
+    """ A pre-warmed pool of spawned worker processes for pool_map.
+
+    Workers load the cached shared object of a function once and keep it loaded. The pool is created on
+    first use with CC_Pool.processes workers, os.cpu_count() when None.
+    """
+
+    processes = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def start(self, processes=None):
+        ''' Start the worker processes, if not already started, and wait until they are running.'''
+        with self.lock:
+            if self.executor is None:
+                processes = processes or self.processes or os.cpu_count() or 1
+                self.executor = ProcessPoolExecutor(
+                    max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+                list(self.executor.map(warm, range(processes)))
+                logger.debug(f'Started {processes} pool processes')
+            return self.executor
+
+    def map(self, spec, tasks, chunksize=1):
+        return list(self.start().map(functools.partial(call, spec), tasks, chunksize=chunksize))
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+
+pool = CC_Pool()
@@ -0,0 +1,229 @@
+import ctypes
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+C_TYPES = {
+    'void': None,
+    '_Bool': ctypes.c_bool,
+    'bool': ctypes.c_bool,
+    'char': ctypes.c_char,
+    'signed char': ctypes.c_byte,
+    'unsigned char': ctypes.c_ubyte,
+    'short': ctypes.c_short,
+    'unsigned short': ctypes.c_ushort,
+    'int': ctypes.c_int,
+    'unsigned int': ctypes.c_uint,
+    'long': ctypes.c_long,
+    'unsigned long': ctypes.c_ulong,
+    'long long': ctypes.c_longlong,
+    'unsigned long long': ctypes.c_ulonglong,
+    'size_t': ctypes.c_size_t,
+    'ssize_t': ctypes.c_ssize_t,
+    'intptr_t': ctypes.c_ssize_t,
+    'uintptr_t': ctypes.c_size_t,
+    'float': ctypes.c_float,
+    'double': ctypes.c_double,
+    'long double': ctypes.c_longdouble,
+    'wchar_t': ctypes.c_wchar,
+    'int8_t': ctypes.c_int8,
+    'uint8_t': ctypes.c_uint8,
+    'int16_t': ctypes.c_int16,
+    'uint16_t': ctypes.c_uint16,
+    'int32_t': ctypes.c_int32,
+    'uint32_t': ctypes.c_uint32,
+    'int64_t': ctypes.c_int64,
+    'uint64_t': ctypes.c_uint64,
+}
+
+# ctypes type: C type name, the first name wins for types with aliases
+C_NAMES = {}
+for _name, _type in C_TYPES.items():
+    C_NAMES.setdefault(_type, _name)
+
+C_POINTERS = {
+    ctypes.c_char: ctypes.c_char_p,
+    ctypes.c_wchar: ctypes.c_wchar_p,
+    None: ctypes.c_void_p,
+}
+
+QUALIFIERS = {'const', 'volatile', 'restrict', '__restrict', '__restrict__', 'static',
+              'inline', '__inline', 'extern', 'register', 'struct'}
+
+TYPE_WORDS = {'void', 'char', 'short', 'int', 'long', 'float', 'double', 'signed',
+              'unsigned', '_Bool', 'bool'} | QUALIFIERS
+
+KEYWORDS = {'return', 'if', 'else', 'while', 'for', 'do', 'switch', 'case', 'sizeof'}
+
+_LITERALS_AND_COMMENTS = re.compile(
+    r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'', re.DOTALL)
+_PREPROCESSOR = re.compile(r'^[ \t]*#(?:[^\n]*\\\n)*[^\n]*', re.MULTILINE)
+_INCLUDE = re.compile(r'^[ \t]*#[ \t]*include[ \t]*"([^"]+)"', re.MULTILINE)
+
+
+class Unsupported(Exception):
+    ''' Raised when a C type has no ctypes equivalent.'''
+
+
+def strip(source):
+    ''' Remove comments, literals and preprocessor lines, leaving declarations.'''
+    source = _LITERALS_AND_COMMENTS.sub(
+        lambda match: ' ' if match.group().startswith('/') else '""', source)
+    return _PREPROCESSOR.sub('', source)
+
+
+def base_type(tokens, known):
+    ''' Map the words of a C type, without pointers, to a ctypes type.'''
+    words = [word for word in tokens if word not in QUALIFIERS]
+    if len(words) > 1 and 'int' in words:
+        words.remove('int')
+    if words[:1] == ['signed'] and words[1:] != ['char']:
+        words = words[1:] or ['int']
+    if words == ['unsigned']:
+        words = ['unsigned', 'int']
+    name = ' '.join(words)
+    if name in C_TYPES:
+        return C_TYPES[name]
+    if name in known:
+        return known[name]
+    raise Unsupported(name)
+
+
+def c_type(declaration, known=None, named=True):
+    ''' Map a C declaration, such as "const int *a" or "int a[]", to a ctypes type.'''
+    known = known or {}
+    if '(' in declaration:
+        return ctypes.c_void_p
+    pointers = declaration.count('*') + declaration.count('[')
+    declaration = re.sub(r'\[[^\]]*\]', ' ', declaration).replace('*', ' ')
+    tokens = declaration.split()
+    if named and len([t for t in tokens if t not in QUALIFIERS]) > 1 and tokens[-1] not in TYPE_WORDS:
+        tokens = tokens[:-1]
+    if not tokens:
+        raise Unsupported(declaration)
+    result = base_type(tokens, known)
+    if pointers:
+        result = C_POINTERS.get(result) or ctypes.POINTER(result)
+        for _ in range(pointers - 1):
+            result = ctypes.POINTER(result)
+    return result
+
+
+def param_name(declaration):
+    ''' The name declared by a parameter declaration, None if it is unnamed.'''
+    match = re.search(r'\(\s*\*\s*(\w+)\s*\)', declaration)
+    if match:
+        return match.group(1)
+    tokens = re.sub(r'\[[^\]]*\]', ' ', declaration).replace('*', ' ').split()
+    if len([t for t in tokens if t not in QUALIFIERS]) > 1 and tokens[-1] not in TYPE_WORDS:
+        return tokens[-1]
+    return None
+
+
+def split_params(params):
+    ''' Split a parameter list on top level commas.'''
+    depth, current, parts = 0, '', []
+    for char in params:
+        if char == ',' and depth == 0:
+            parts.append(current)
+            current = ''
+            continue
+        depth += {'(': 1, ')': -1}.get(char, 0)
+        current += char
+    parts.append(current)
+    return [part.strip() for part in parts]
+
+
+def find_prototype(source, name):
+    ''' Find the return declaration and parameter list of a function declaration or definition.
+
+        Returns:
+            (str, [str]): The return type and parameter declarations, or None if not found.
+    '''
+    source = strip(source)
+    for match in re.finditer(rf'(?<![\w.>]){re.escape(name)}\s*\(', source):
+        depth, end = 1, match.end()
+        while end < len(source) and depth:
+            depth += {'(': 1, ')': -1}.get(source[end], 0)
+            end += 1
+        following = source[end:].lstrip()[:1]
+        head = re.split(r'[;{}]', source[:match.start()])[-1].strip()
+        if depth or following not in ('{', ';') or not head:
+            continue
+        if set('=(,') & set(head) or head.split()[-1] in KEYWORDS:
+            continue
+        return head, split_params(source[match.end():end - 1])
+    return None
+
+
+def includes(source, include_dirs, seen=None):
+    ''' Yield the paths of local headers included by the source, recursively.'''
+    seen = set() if seen is None else seen
+    for header in _INCLUDE.findall(source):
+        for directory in include_dirs:
+            path = os.path.abspath(os.path.join(directory, header))
+            if os.path.isfile(path):
+                if path not in seen:
+                    seen.add(path)
+                    yield path
+                    with open(path) as file:
+                        yield from includes(file.read(), include_dirs, seen)
+                break
+
+
+def sources(code, config, directory):
+    ''' Yield the C sources that may declare a function: the prelude, the code, src files and their local headers.
+
+        Args:
+            code (str): The inline code.
+            config (CC_Config): The config with the prelude, src files and includes.
+            directory (str): The directory of the defining python file, searched for headers after the includes.
+    '''
+    texts = [text for text in (config.prelude, code) if text]
+    for src in config.src_files:
+        if os.path.splitext(src)[1] in ('.c', '.h') and os.path.isfile(src):
+            with open(src) as file:
+                texts.append(file.read())
+    yield from texts
+    seen = set()
+    for text in texts:
+        for header in includes(text, [*config.includes, directory], seen):
+            with open(header) as file:
+                yield file.read()
+
+
+def c_signature(sources, name, known=None):
+    ''' Parse the ctypes signature of a function from C sources.
+
+        Args:
+            sources (str,..): C source texts to search in order.
+            name (str): The function name.
+            known ({str: type}): Additional type names, such as struct typedefs, mapped to ctypes types.
+
+        Returns:
+            (type, [type]): The restype and argtypes. None when the prototype is not found, argtypes
+            is None when a parameter is not supported, such as varargs or unknown types.
+    '''
+    for source in sources:
+        prototype = find_prototype(source, name)
+        if prototype:
+            break
+    else:
+        return None
+    head, params = prototype
+    try:
+        restype = c_type(head, known, named=False)
+    except Unsupported as e:
+        logger.debug(f'Unsupported return type for {name}: {e}')
+        restype = ctypes.c_int
+    if params in ([''], ['void']):
+        return restype, []
+    try:
+        if '...' in params:
+            raise Unsupported('...')
+        return restype, [c_type(param, known) for param in params]
+    except Unsupported as e:
+        logger.debug(f'Unsupported parameter type for {name}: {e}')
+        return restype, None
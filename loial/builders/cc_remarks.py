@@ -0,0 +1,71 @@
+import os
+import re
+
+_REMARK = re.compile(
+    r'^(?P<file>[^:\n]+):(?P<line>\d+):(?P<column>\d+): (?P<kind>optimized|missed|note|remark): (?P<message>.*?)'
+    r'(?: \[(?P<flag>-R[^\]]+)\])?$', re.MULTILINE)
+_GCC_INLINED = re.compile(r'Inlining (?P<callee>[^/\s]+)/\d+ into (?P<caller>[^/\s]+)/\d+')
+_CLANG_INLINED = re.compile(r"'(?P<callee>[^']+)' inlined into '(?P<caller>[^']+)'")
+
+GCC_FLAGS = ['-fopt-info-vec-all', '-fopt-info-inline-optimized-missed']
+CLANG_FLAGS = ['-Rpass=loop-vectorize', '-Rpass-missed=loop-vectorize', '-Rpass-analysis=loop-vectorize',
+               '-Rpass=inline', '-Rpass-missed=inline']
+
+
+def flags(clang):
+    ''' The compiler options writing vectorization and inlining remarks to stderr.'''
+    return CLANG_FLAGS if clang else GCC_FLAGS
+
+
+def parse(text, source=None):
+    ''' Parse gcc -fopt-info or clang -Rpass remarks into a report.
+
+        Args:
+            text (str): The compiler stderr.
+            source (str): The compiled source file name, its remarks are reported without a file.
+
+        Returns:
+            dict: Lists of vectorized loops, missed loops with reasons, inlined calls and calls not inlined.
+            Each entry has the line, column and message, and the file when it is not the source.
+    '''
+    report = {'vectorized': [], 'missed': [], 'inlined': [], 'not_inlined': []}
+    for match in _REMARK.finditer(text):
+        kind, message, flag = match['kind'], match['message'].strip(), match['flag'] or ''
+        entry = {'line': int(match['line']), 'column': int(match['column']), 'message': message}
+        if not source or os.path.basename(match['file']) != os.path.basename(source):
+            entry['file'] = match['file']
+        inlined = _GCC_INLINED.search(message) or _CLANG_INLINED.search(message)
+        if kind == 'optimized' and 'vectorized' in message or flag == '-Rpass=loop-vectorize':
+            report['vectorized'].append(entry)
+        elif inlined and (kind == 'optimized' or flag == '-Rpass=inline'):
+            report['inlined'].append({**entry, 'callee': inlined['callee'], 'caller': inlined['caller']})
+        elif kind == 'missed' and 'inlin' in message or flag == '-Rpass-missed=inline':
+            report['not_inlined'].append(entry)
+        elif message.startswith("couldn't vectorize loop") or flag == '-Rpass-missed=loop-vectorize':
+            report['missed'].append({**entry, 'reasons': []})
+        elif kind == 'missed' and 'not vectorized' in message or flag == '-Rpass-analysis=loop-vectorize':
+            # reasons follow the missed loop, at the statement that stopped vectorization
+            reason = message.split('not vectorized', 1)[-1].lstrip(': ')
+            if not report['missed']:
+                report['missed'].append({**entry, 'reasons': []})
+            if reason and reason not in report['missed'][-1]['reasons']:
+                report['missed'][-1]['reasons'].append(reason)
+    return report
+
+
+def describe(report, name=None):
+    ''' Format a report as text, one remark per line.'''
+    lines = [name] if name else []
+    for section in ('vectorized', 'missed', 'inlined', 'not_inlined'):
+        for entry in report.get(section, []):
+            where = f'{entry.get("file", "")}:{entry["line"]}:{entry["column"]}'.lstrip(':')
+            if section == 'inlined':
+                message = f'{entry["callee"]} into {entry["caller"]}'
+            elif section == 'missed' and entry['reasons']:
+                message = f'{entry["message"]}: {"; ".join(entry["reasons"])}'
+            else:
+                message = entry['message']
+            lines.append(f'  {section:12} {where:10} {message}')
+    if len(lines) == (1 if name else 0):
+        lines.append('  no remarks')
+    return '\n'.join(lines)
@@ -0,0 +1,218 @@
+import ctypes
+import hashlib
+import importlib.util
+import inspect
+import logging
+import os
+import sys
+import sysconfig
+from copy import deepcopy
+from pathlib import Path
+from .builder import BaseBuilder
+from .cc_builder import CC_Builder, CC_Config, known_types
+from . import cc_prototype
+
+logger = logging.getLogger(__name__)
+
+
+def cext_build(code='', config=None, replace=True, memoize=None):
+    """ Helper decorator to default the code_type to 'CExt' """
+    from ..builder import build
+    return build(code, code_type='CExt', config=config, replace=replace, memoize=memoize)
+
+
+# ctypes type: (C local type, conversion from PyObject *, conversion to PyObject *)
+CONVERSIONS = {
+    ctypes.c_bool: ('int', 'PyObject_IsTrue', 'PyBool_FromLong'),
+    ctypes.c_byte: ('long', 'PyLong_AsLong', 'PyLong_FromLong'),
+    ctypes.c_short: ('long', 'PyLong_AsLong', 'PyLong_FromLong'),
+    ctypes.c_int: ('long', 'PyLong_AsLong', 'PyLong_FromLong'),
+    ctypes.c_long: ('long', 'PyLong_AsLong', 'PyLong_FromLong'),
+    ctypes.c_longlong: ('long long', 'PyLong_AsLongLong', 'PyLong_FromLongLong'),
+    ctypes.c_ubyte: ('unsigned long', 'PyLong_AsUnsignedLong', 'PyLong_FromUnsignedLong'),
+    ctypes.c_ushort: ('unsigned long', 'PyLong_AsUnsignedLong', 'PyLong_FromUnsignedLong'),
+    ctypes.c_uint: ('unsigned long', 'PyLong_AsUnsignedLong', 'PyLong_FromUnsignedLong'),
+    ctypes.c_ulong: ('unsigned long', 'PyLong_AsUnsignedLong', 'PyLong_FromUnsignedLong'),
+    ctypes.c_ulonglong: ('unsigned long long', 'PyLong_AsUnsignedLongLong', 'PyLong_FromUnsignedLongLong'),
+    ctypes.c_float: ('double', 'PyFloat_AsDouble', 'PyFloat_FromDouble'),
+    ctypes.c_double: ('double', 'PyFloat_AsDouble', 'PyFloat_FromDouble'),
+    ctypes.c_char_p: ('const char *', 'loial_as_string', 'loial_from_string'),
+    ctypes.c_void_p: ('void *', 'PyLong_AsVoidPtr', 'PyLong_FromVoidPtr'),
+}
+
+PRELUDE = '''#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+'''
+
+HELPERS = '''
+static const char *loial_as_string(PyObject *o) {
+    if (PyUnicode_Check(o))
+        return PyUnicode_AsUTF8(o);
+    return PyBytes_AsString(o);
+}
+
+static PyObject *loial_from_string(const char *s) {
+    if (!s)
+        Py_RETURN_NONE;
+    return PyBytes_FromString(s);
+}
+'''
+
+
+class CExt_Builder(BaseBuilder):
+    """ CPython extension builder, wrapping a C function in a generated METH_FASTCALL extension module.
+
+    The generated wrapper unpacks arguments with the CPython API instead of ctypes, giving near native
+    call overhead. Argument and return types come from ctypes hints in the method signature, otherwise
+    from the C prototype. Only scalar, ctypes.c_char_p and ctypes.c_void_p types are supported, other
+    functions fall back to Python:
+
+        @cext_build('''
+        double hypot2(double a, double b) {
+            return a * a + b * b;
+        }
+        ''')
+        def hypot2(a, b):
+            ...
+
+    str arguments to const char* parameters use the UTF-8 buffer cached on the str object. The
+    CC_Config options for the compiler, cache, includes and libraries apply as for CC_Builder.
+    """
+
+    def __init__(self, code, config=None):
+        self.config = config if config else CC_Config()
+        BaseBuilder.__init__(self, code, config)
+
+    def signature(self):
+        ''' Resolve the ctypes return and argument types from the hints, falling back to the prototype.'''
+        fun_name = self.config.function if self.config.function else self.fun.__name__
+        directory = Path(self.fun.__code__.co_filename).parent.absolute()
+        parsed = cc_prototype.c_signature(
+            cc_prototype.sources(self.code, self.config, directory), fun_name, known_types(self.sig))
+        restype, argtypes = parsed if parsed else (ctypes.c_int, None)
+        params = list(self.sig.parameters.values())
+        if argtypes is None:
+            argtypes = [None] * len(params)
+        types = []
+        for param, c_type in zip(params, argtypes):
+            if param.annotation is not inspect.Parameter.empty:
+                c_type = param.annotation
+            types.append(c_type)
+        if self.sig.return_annotation is not inspect.Parameter.empty:
+            restype = self.sig.return_annotation
+        return fun_name, restype, types
+
+    def generate(self, fun_name, restype, argtypes, module_name):
+        ''' Generate the extension module source wrapping the function.'''
+        lines = []
+        for i, c_type in enumerate(argtypes):
+            local, from_py, _ = CONVERSIONS[c_type]
+            error = f'a{i} == NULL' if local.endswith('*') else f'a{i} == ({local})-1'
+            lines.append(f'    {local} a{i} = {from_py}(args[{i}]);')
+            lines.append(f'    if ({error} && PyErr_Occurred())\n        return NULL;')
+        call = f'{fun_name}({", ".join(f"a{i}" for i in range(len(argtypes)))})'
+        if restype is None:
+            lines.append(f'    {call};\n    Py_RETURN_NONE;')
+        else:
+            local, _, to_py = CONVERSIONS[restype]
+            lines.append(f'    {local} r = {call};\n    return {to_py}(r);')
+        body = '\n'.join(lines)
+        return f'''{PRELUDE}
+{self.code}
+{HELPERS}
+static PyObject *loial_wrap_{fun_name}(PyObject *self, PyObject *const *args, Py_ssize_t nargs) {{
+    if (nargs != {len(argtypes)}) {{
+        PyErr_Format(PyExc_TypeError, "{fun_name}() takes {len(argtypes)} arguments (%zd given)", nargs);
+        return NULL;
+    }}
+{body}
+}}
+
+static PyMethodDef loial_methods[] = {{
+    {{"{fun_name}", (PyCFunction)(void (*)(void))loial_wrap_{fun_name}, METH_FASTCALL, NULL}},
+    {{NULL, NULL, 0, NULL}}
+}};
+
+static struct PyModuleDef loial_module = {{
+    PyModuleDef_HEAD_INIT, "{module_name}", NULL, -1, loial_methods
+}};
+
+PyMODINIT_FUNC PyInit_{module_name}(void) {{
+    return PyModule_Create(&loial_module);
+}}
+'''
+
+    def compile(self, fun):
+        self.fun = fun
+        self.sig = inspect.signature(fun)
+        fun_name, restype, argtypes = self.signature()
+        unsupported = [t for t in argtypes + [restype] if t is not None and t not in CONVERSIONS]
+        if None in argtypes or unsupported:
+            logger.error(f'Unsupported extension types for {fun_name}: {unsupported}')
+            return None
+        hash = hashlib.md5(
+            ((self.config.prelude or '') + self.code + repr((restype, argtypes))).encode('utf-8')).hexdigest()
+        module_name = f'_loial_{hash}'
+        source = self.generate(fun_name, restype, argtypes, module_name)
+        ext = sysconfig.get_config_var('EXT_SUFFIX')
+        self.so_file = self.config.create_cache_path(
+            f'lib{fun.__module__}.{fun.__name__}_{hash}{ext}')
+        logger.debug(f'Extension module file: {self.so_file}')
+
+        self.compiled = False
+        with CC_Builder.build_lock(self.so_file):
+            if not os.path.exists(self.so_file) and not self.build(source):
+                return None
+
+        try:
+            spec = importlib.util.spec_from_file_location(module_name, self.so_file)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        except Exception:
+            logger.error(
+                f'Failed to import extension: {self.so_file}', exc_info=True)
+            return None
+        self.native = getattr(module, fun_name)
+        self.arg_count = len(argtypes)
+        return self
+
+    def build(self, source):
+        ''' Compile the extension module, to a temporary file renamed into place.'''
+        directory = Path(self.fun.__code__.co_filename).parent.absolute()
+        failed = f'{self.so_file}.{CC_Builder.recipe(source, self.config, directory)}.failed'
+        if os.path.exists(failed):
+            logger.info(f'Skipping build that failed before with the same inputs: {failed}')
+            return False
+        if not CC_Builder.compiler_available(self.config):
+            return False
+        config = deepcopy(self.config)
+        config.includes = [*config.includes, sysconfig.get_paths()['include'], directory]
+        if sys.platform == 'darwin':
+            config.compiler_opts = [*config.compiler_opts, '-undefined', 'dynamic_lookup']
+        if config.prelude:
+            config = CC_Builder.with_prelude(config)
+        building = f'{self.so_file}.{os.getpid()}.tmp'
+        if not CC_Builder.cc_compile(source, building, config, src_filename=f'{self.so_file}.c'):
+            Path(failed).touch()
+            return False
+        os.replace(building, self.so_file)
+        self.compiled = True
+        return True
+
+    def __call__(self, *args, **kwargs):
+        if not kwargs and len(args) == self.arg_count:
+            return self.native(*args)
+        bound = self.sig.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return self.native(*bound.args[:self.arg_count])
+
+    def clean(self):
+        ''' Clean up the compiled extension module file.'''
+        CC_Builder.remove(self.so_file)
+        CC_Builder.remove(self.so_file and f'{self.so_file}.c')
+        self.so_file = None
+
+    def __del__(self):
+        ''' Destructor to clean up the compiled extension module file.'''
+        if self.config.delete_on_exit and getattr(self, 'so_file', None):
+            self.clean()
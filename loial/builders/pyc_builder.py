@@ -0,0 +1,533 @@
+import ast
+import ctypes
+import inspect
+import logging
+import sys
+import textwrap
+import types
+import typing
+from copy import deepcopy
+from .builder import BaseBuilder
+from .cc_builder import CC_Builder, CC_Config
+from .cc_prototype import C_NAMES
+
+logger = logging.getLogger(__name__)
+
+
+def pyc_build(code='', config=None, replace=True, memoize=None):
+    """ Helper decorator to default the code_type to 'PyC' """
+    from ..builder import build
+    return build(code, code_type='PyC', config=config, replace=replace, memoize=memoize)
+
+
+PYTHON_TYPES = {int: ctypes.c_long, float: ctypes.c_double, bool: ctypes.c_bool}
+
+FLOATS = {ctypes.c_float, ctypes.c_double, ctypes.c_longdouble}
+
+HELPERS = '''#include <math.h>
+
+static inline long loial_floordiv(long a, long b) {
+    long q = a / b;
+    return (q * b != a && ((a < 0) != (b < 0))) ? q - 1 : q;
+}
+
+static inline long loial_mod(long a, long b) {
+    long r = a % b;
+    return (r != 0 && ((r < 0) != (b < 0))) ? r + b : r;
+}
+
+static inline double loial_fmod(double a, double b) {
+    double r = fmod(a, b);
+    return (r != 0 && ((r < 0) != (b < 0))) ? r + b : r;
+}
+'''
+
+# divisions by values not known to be non zero raise ZeroDivisionError, setting the Python error and jumping
+# out of the function, which is loaded holding the GIL so ctypes raises the error
+DIVISION_HELPERS = '''#include <setjmp.h>
+
+extern void PyErr_SetString(void *type, const char *message);
+extern void *PyExc_ZeroDivisionError;
+
+static void loial_zero_division(jmp_buf env) {
+    PyErr_SetString(PyExc_ZeroDivisionError, "division by zero");
+    longjmp(env, 1);
+}
+
+static inline long loial_checked(long b, jmp_buf env) {
+    if (b == 0)
+        loial_zero_division(env);
+    return b;
+}
+
+static inline double loial_fchecked(double b, jmp_buf env) {
+    if (b == 0)
+        loial_zero_division(env);
+    return b;
+}
+'''
+
+OPERATORS = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/', ast.LShift: '<<',
+             ast.RShift: '>>', ast.BitOr: '|', ast.BitXor: '^', ast.BitAnd: '&'}
+
+COMPARISONS = {ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<',
+               ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>='}
+
+# math function: argument count
+MATH = {'sqrt': 1, 'exp': 1, 'log': 1, 'log2': 1, 'log10': 1, 'sin': 1, 'cos': 1, 'tan': 1, 'asin': 1,
+        'acos': 1, 'atan': 1, 'atan2': 2, 'sinh': 1, 'cosh': 1, 'tanh': 1, 'fabs': 1, 'pow': 2, 'hypot': 2,
+        'copysign': 2, 'fmod': 2}
+
+C_KEYWORDS = {'auto', 'case', 'char', 'const', 'default', 'do', 'double', 'enum', 'extern', 'float',
+              'goto', 'inline', 'int', 'long', 'register', 'restrict', 'short', 'signed', 'sizeof',
+              'static', 'struct', 'switch', 'typedef', 'union', 'unsigned', 'void', 'volatile',
+              'floor', 'ceil', 'trunc', 'labs', 'fabs', 'pow', 'fmod'} | {*MATH}
+
+MATH_CONSTANTS = {'pi': 'M_PI', 'e': 'M_E', 'tau': '(2 * M_PI)'}
+
+
+class Unsupported(Exception):
+    ''' Raised when the Python function uses a construct outside the translated subset.'''
+
+
+class Translator:
+    ''' Translate the typed body of a Python function into a C function.
+
+        Locals are declared at the top of the C function with the type of their first assignment, ints
+        are C long and floats C double. Python floor division and modulo semantics are kept.
+    '''
+
+    def __init__(self, fun, sig):
+        self.fun = fun
+        self.sig = sig
+        self.params = {}
+        self.arrays = {}
+        self.locals = {}
+        self.loops = 0
+        self.indexes = set()
+        self.assigned = set()
+        self.stored = set()
+        self.divides = False
+
+    @staticmethod
+    def c_type(annotation):
+        ''' Map a scalar annotation, a Python or ctypes scalar type, to a ctypes type.'''
+        c_type = PYTHON_TYPES.get(annotation, annotation)
+        if c_type not in C_NAMES or c_type is None or c_type in (ctypes.c_char, ctypes.c_wchar):
+            raise Unsupported(f'type {annotation}')
+        return c_type
+
+    @staticmethod
+    def kind(c_type):
+        return 'double' if c_type in FLOATS else 'long'
+
+    def signature(self):
+        ''' The C declarations of the parameters and the CC_Builder hints.'''
+        declarations, hints = [], []
+        for name, param in self.sig.parameters.items():
+            annotation = param.annotation
+            if param.kind not in (param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD):
+                raise Unsupported(f'parameter kind of {name}')
+            if typing.get_origin(annotation) is list:
+                element = Translator.c_type(typing.get_args(annotation)[0])
+                self.arrays[name] = Translator.kind(element)
+                declarations.append(f'{C_NAMES[element]} *{name}')
+                hints.append(param.replace(annotation=element))
+            elif annotation is inspect.Parameter.empty:
+                raise Unsupported(f'missing type hint for {name}')
+            else:
+                c_type = Translator.c_type(annotation)
+                self.params[name] = Translator.kind(c_type)
+                declarations.append(f'{C_NAMES[c_type]} {name}')
+                hints.append(param.replace(annotation=c_type))
+        return declarations, hints
+
+    def translate(self):
+        ''' Translate the function.
+
+            Returns:
+                (str, inspect.Signature): The C source and the signature with CC_Builder hints.
+        '''
+        source = textwrap.dedent(inspect.getsource(self.fun))
+        node = ast.parse(source).body[0]
+        if not isinstance(node, ast.FunctionDef):
+            raise Unsupported(type(node).__name__)
+        declarations, hints = self.signature()
+        returns = self.sig.return_annotation
+        restype = None
+        if returns not in (inspect.Signature.empty, None):
+            restype = Translator.c_type(returns)
+        self.returns = restype and Translator.kind(restype)
+        body = node.body
+        if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant):
+            body = body[1:]
+        if self.returns and not Translator.returns(body):
+            raise Unsupported('function that may end without returning a value')
+        self.stored = {target.id for target in ast.walk(node)
+                       if isinstance(target, ast.Name) and isinstance(target.ctx, ast.Store)}
+        self.assigned = set(self.params) | set(self.arrays)
+        lines = self.block(body, 1)
+        names = [f'    {kind} {name};' for name, kind in self.locals.items()]
+        result = C_NAMES[restype] if restype else 'void'
+        params = ', '.join(declarations) or 'void'
+        helpers = [HELPERS]
+        if self.divides:
+            helpers.append(DIVISION_HELPERS)
+            names += ['    jmp_buf loial_env;', f'    if (setjmp(loial_env))\n        return{" 0" if restype else ""};']
+        code = '\n'.join([*helpers, f'{result} {self.fun.__name__}({params}) {{', *names, *lines, '}', ''])
+        return code, self.sig.replace(parameters=hints, return_annotation=restype)
+
+    @staticmethod
+    def returns(statements):
+        ''' Whether the statements always end with a return.'''
+        last = statements[-1] if statements else None
+        if isinstance(last, ast.If):
+            return Translator.returns(last.body) and Translator.returns(last.orelse)
+        return isinstance(last, ast.Return)
+
+    @staticmethod
+    def leaves(statements):
+        ''' Whether the statements always end with a return, break or continue.'''
+        last = statements[-1] if statements else None
+        if isinstance(last, ast.If):
+            return Translator.leaves(last.body) and Translator.leaves(last.orelse)
+        return isinstance(last, (ast.Return, ast.Break, ast.Continue))
+
+    def block(self, statements, depth):
+        lines = []
+        for statement in statements:
+            lines += self.statement(statement, depth)
+        return lines
+
+    def statement(self, node, depth):
+        pad = '    ' * depth
+        if isinstance(node, ast.Return):
+            if node.value is None:
+                return [f'{pad}return;']
+            if self.returns is None:
+                raise Unsupported('return value without a return type hint')
+            code, kind = self.expression(node.value)
+            if self.returns == 'long' and kind == 'double':
+                raise Unsupported('return of a float from an int function')
+            return [f'{pad}return {code};']
+        if isinstance(node, ast.Assign):
+            if len(node.targets) != 1:
+                raise Unsupported('multiple assignment')
+            return [f'{pad}{self.assign(node.targets[0], node.value)};']
+        if isinstance(node, ast.AnnAssign):
+            if not isinstance(node.target, ast.Name) or node.value is None:
+                raise Unsupported('annotated declaration')
+            annotation = eval(compile(ast.Expression(node.annotation), '<annotation>', 'eval'),
+                              self.fun.__globals__)
+            self.declare(node.target.id, Translator.kind(Translator.c_type(annotation)))
+            return [f'{pad}{self.assign(node.target, node.value)};']
+        if isinstance(node, ast.AugAssign):
+            value = ast.BinOp(left=node.target, op=node.op, right=node.value)
+            return [f'{pad}{self.assign(node.target, value)};']
+        if isinstance(node, ast.If):
+            # after the if, locals are assigned when assigned by every branch that carries on
+            test = self.expression(node.test)[0]
+            before = set(self.assigned)
+            lines = [f'{pad}if ({test}) {{', *self.block(node.body, depth + 1)]
+            branches = [] if Translator.leaves(node.body) else [self.assigned]
+            self.assigned = set(before)
+            if node.orelse:
+                lines += [f'{pad}}} else {{', *self.block(node.orelse, depth + 1)]
+            if not Translator.leaves(node.orelse):
+                branches.append(self.assigned)
+            self.assigned = set.intersection(*branches) if branches else before
+            return lines + [f'{pad}}}']
+        if isinstance(node, ast.While):
+            if node.orelse:
+                raise Unsupported('while else')
+            test = self.expression(node.test)[0]
+            before = set(self.assigned)
+            body = self.block(node.body, depth + 1)
+            # the body may not run
+            self.assigned = before
+            return [f'{pad}while ({test}) {{', *body, f'{pad}}}']
+        if isinstance(node, ast.For):
+            return self.loop(node, depth)
+        if isinstance(node, ast.Break):
+            return [f'{pad}break;']
+        if isinstance(node, ast.Continue):
+            return [f'{pad}continue;']
+        if isinstance(node, ast.Pass):
+            return []
+        raise Unsupported(type(node).__name__)
+
+    def loop(self, node, depth):
+        ''' Translate a for range loop, the loop variable keeps its last value after the loop as in Python.'''
+        pad = '    ' * depth
+        call = node.iter
+        if (node.orelse or not isinstance(node.target, ast.Name) or not isinstance(call, ast.Call)
+                or not isinstance(call.func, ast.Name) or call.func.id != 'range' or call.keywords
+                or not 1 <= len(call.args) <= 3):
+            raise Unsupported('for loop other than over a range')
+        bounds = [self.expression(arg) for arg in call.args]
+        if any(kind != 'long' for _, kind in bounds):
+            raise Unsupported('range of a float')
+        bounds = [bound for bound, _ in bounds]
+        start, stop = ['0L', *bounds][-2:] if len(bounds) == 1 else bounds[:2]
+        step = Translator.constant(call.args[2]) if len(call.args) == 3 else 1
+        if not isinstance(step, int) or step == 0:
+            raise Unsupported('range step that is not a non zero constant')
+        # the loop variable indexes arrays in the loop body when its values are never negative
+        first = ([ast.Constant(0), *call.args] if len(call.args) == 1 else call.args)[0 if step > 0 else 1]
+        index = self.non_negative(first)
+        step = f'{step}L'
+        target = node.target.id
+        if target in self.indexes:
+            raise Unsupported(f'assignment to the loop index {target}')
+        self.declare(target, 'long')
+        self.loops += 1
+        i, end = f'loial_i{self.loops}', f'loial_stop{self.loops}'
+        compare = '>' if step.startswith('-') else '<'
+        if index:
+            self.indexes.add(target)
+        before = set(self.assigned)
+        self.assigned.add(target)
+        try:
+            body = self.block(node.body, depth + 1)
+        finally:
+            self.indexes.discard(target)
+        # the body may not run
+        self.assigned = before
+        return [f'{pad}for (long {i} = {start}, {end} = {stop}; {i} {compare} {end}; {i} += {step}) {{',
+                f'{pad}    {target} = {i};', *body, f'{pad}}}']
+
+    def non_negative(self, node):
+        ''' Whether an int expression is known not to be negative: a constant, a loop index counting from a
+            non negative start, or sums and products of those.'''
+        if isinstance(node, ast.Constant):
+            return isinstance(node.value, int) and node.value >= 0
+        if isinstance(node, ast.Name):
+            return node.id in self.indexes
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Mult)):
+            return self.non_negative(node.left) and self.non_negative(node.right)
+        return False
+
+    @staticmethod
+    def constant(node):
+        ''' The value of a literal node, None if it is not a literal.'''
+        try:
+            return ast.literal_eval(node)
+        except ValueError:
+            return None
+
+    def declare(self, name, kind):
+        if name in C_KEYWORDS or name.startswith('loial_'):
+            raise Unsupported(f'name {name}')
+        if name in self.params or name in self.arrays:
+            if self.arrays.get(name) or self.params[name] != kind:
+                raise Unsupported(f'assignment changing the type of {name}')
+            return
+        if self.locals.setdefault(name, kind) != kind:
+            raise Unsupported(f'assignment changing the type of {name}')
+
+    def assign(self, target, value):
+        code, kind = self.expression(value)
+        if isinstance(target, ast.Name):
+            if target.id in self.arrays:
+                raise Unsupported(f'assignment to array {target.id}')
+            if target.id in self.indexes:
+                raise Unsupported(f'assignment to the loop index {target.id}')
+            current = self.params.get(target.id, self.locals.get(target.id))
+            if current == 'long' and kind == 'double':
+                raise Unsupported(f'assignment of a float to int {target.id}')
+            self.declare(target.id, current or kind)
+            self.assigned.add(target.id)
+            return f'{target.id} = {code}'
+        if isinstance(target, ast.Subscript):
+            element, element_kind = self.expression(target)
+            if element_kind == 'long' and kind == 'double':
+                raise Unsupported('assignment of a float to an int array')
+            return f'{element} = {code}'
+        raise Unsupported(type(target).__name__)
+
+    def expression(self, node):
+        ''' Translate an expression.
+
+            Returns:
+                (str, str): The C expression and its kind, 'long' or 'double'.
+        '''
+        if isinstance(node, ast.Constant):
+            value = node.value
+            if isinstance(value, bool):
+                return ('1L' if value else '0L'), 'long'
+            if isinstance(value, int):
+                return f'{value}L', 'long'
+            if isinstance(value, float) and value == value and abs(value) != float('inf'):
+                return repr(value), 'double'
+            raise Unsupported(f'constant {value!r}')
+        if isinstance(node, ast.Name):
+            if node.id in self.params:
+                return node.id, self.params[node.id]
+            if node.id in self.stored:
+                if node.id not in self.assigned:
+                    raise Unsupported(f'local {node.id} that may be used before assignment')
+                return node.id, self.locals[node.id]
+            value = self.fun.__globals__.get(node.id)
+            if isinstance(value, (int, float)) and node.id not in self.arrays:
+                return self.expression(ast.Constant(value))
+            raise Unsupported(f'name {node.id}')
+        if isinstance(node, ast.Subscript):
+            if not isinstance(node.value, ast.Name) or node.value.id not in self.arrays:
+                raise Unsupported('subscript of a non array')
+            index, kind = self.expression(node.slice)
+            if kind != 'long' or not self.non_negative(node.slice):
+                # the array length is not known, so Python's negative indexes can not be translated
+                raise Unsupported('array index that is not known to be non negative')
+            return f'{node.value.id}[{index}]', self.arrays[node.value.id]
+        if isinstance(node, ast.BinOp):
+            return self.binary(node)
+        if isinstance(node, ast.UnaryOp):
+            operand, kind = self.expression(node.operand)
+            if isinstance(node.op, ast.Not):
+                return f'(!{operand})', 'long'
+            if isinstance(node.op, ast.Invert) and kind == 'long':
+                return f'(~{operand})', 'long'
+            if isinstance(node.op, (ast.USub, ast.UAdd)):
+                return f'({"-" if isinstance(node.op, ast.USub) else "+"}{operand})', kind
+            raise Unsupported(type(node.op).__name__)
+        if isinstance(node, ast.BoolOp):
+            # C && and || give 0 or 1, so only operands that are already truth values are translated
+            if not all(Translator.truth(value) for value in node.values):
+                raise Unsupported('and/or of values other than comparisons')
+            operator = ' && ' if isinstance(node.op, ast.And) else ' || '
+            return f'({operator.join(self.expression(value)[0] for value in node.values)})', 'long'
+        if isinstance(node, ast.Compare):
+            parts, left = [], self.expression(node.left)[0]
+            for op, comparator in zip(node.ops, node.comparators):
+                if type(op) not in COMPARISONS:
+                    raise Unsupported(type(op).__name__)
+                right = self.expression(comparator)[0]
+                parts.append(f'({left} {COMPARISONS[type(op)]} {right})')
+                left = right
+            return f'({" && ".join(parts)})', 'long'
+        if isinstance(node, ast.IfExp):
+            test = self.expression(node.test)[0]
+            body, body_kind = self.expression(node.body)
+            orelse, orelse_kind = self.expression(node.orelse)
+            kind = 'double' if 'double' in (body_kind, orelse_kind) else 'long'
+            return f'({test} ? {body} : {orelse})', kind
+        if isinstance(node, ast.Call):
+            return self.call(node)
+        if isinstance(node, ast.Attribute):
+            if isinstance(node.value, ast.Name) and node.value.id == 'math' and node.attr in MATH_CONSTANTS:
+                return MATH_CONSTANTS[node.attr], 'double'
+        raise Unsupported(type(node).__name__)
+
+    @staticmethod
+    def truth(node):
+        return (isinstance(node, (ast.Compare, ast.BoolOp))
+                or (isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not))
+                or (isinstance(node, ast.Constant) and isinstance(node.value, bool)))
+
+    def binary(self, node):
+        left, left_kind = self.expression(node.left)
+        right, right_kind = self.expression(node.right)
+        kind = 'double' if 'double' in (left_kind, right_kind) else 'long'
+        if isinstance(node.op, (ast.Div, ast.FloorDiv, ast.Mod)) and not Translator.constant(node.right):
+            self.divides = True
+            right = f'loial_{"f" if kind == "double" else ""}checked({right}, loial_env)'
+        if isinstance(node.op, ast.Div):
+            return f'((double){left} / {right})', 'double'
+        if isinstance(node.op, ast.FloorDiv):
+            if kind == 'long':
+                return f'loial_floordiv({left}, {right})', kind
+            return f'floor({left} / {right})', kind
+        if isinstance(node.op, ast.Mod):
+            return f'loial_{"mod" if kind == "long" else "fmod"}({left}, {right})', kind
+        if isinstance(node.op, ast.Pow):
+            if kind == 'long':
+                raise Unsupported('int power')
+            return f'pow({left}, {right})', kind
+        if type(node.op) not in OPERATORS:
+            raise Unsupported(type(node.op).__name__)
+        if kind == 'double' and type(node.op) not in (ast.Add, ast.Sub, ast.Mult):
+            raise Unsupported(f'{type(node.op).__name__} of floats')
+        return f'({left} {OPERATORS[type(node.op)]} {right})', kind
+
+    def call(self, node):
+        if node.keywords:
+            raise Unsupported('keyword arguments')
+        args = [self.expression(arg) for arg in node.args]
+        kinds = {kind for _, kind in args}
+        kind = 'double' if 'double' in kinds else 'long'
+        codes = [code for code, _ in args]
+        func = node.func
+        if isinstance(func, ast.Name):
+            if func.id == 'abs' and len(args) == 1:
+                return f'{"fabs" if kind == "double" else "labs"}({codes[0]})', kind
+            if func.id == 'float' and len(args) == 1:
+                return f'((double){codes[0]})', 'double'
+            if func.id == 'int' and len(args) == 1:
+                return f'((long){codes[0]})', 'long'
+            if func.id in ('min', 'max') and len(args) >= 2:
+                compare = '<' if func.id == 'min' else '>'
+                result = codes[0]
+                for code in codes[1:]:
+                    result = f'(({code}) {compare} ({result}) ? ({code}) : ({result}))'
+                return result, kind
+        if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) and func.value.id == 'math':
+            if MATH.get(func.attr) == len(args):
+                return f'{func.attr}({", ".join(codes)})', 'double'
+            if func.attr in ('floor', 'ceil', 'trunc') and len(args) == 1:
+                return f'((long){func.attr}({codes[0]}))', 'long'
+        raise Unsupported(f'call of {ast.unparse(func)}')
+
+
+class PyC_Builder(BaseBuilder):
+    """ Python subset to C builder, translating the typed body of the decorated function to C and
+    compiling it with CC_Builder:
+
+        @pyc_build()
+        def dot(a: list[float], b: list[float], n: int) -> float:
+            total = 0.0
+            for i in range(n):
+                total += a[i] * b[i]
+            return total
+
+    Parameters need hints: int, float, bool or ctypes scalar types, and list[...] of those for arrays.
+    The body may use assignments, if, while and for range loops, arithmetic, comparisons, array
+    indexing, abs, min, max, int, float and math functions. Arrays are indexed by non negative constants,
+    range loop variables counting from a non negative start, and sums and products of those. Functions
+    using anything else, such as other calls, other array indices or len, locals that may be read before
+    assignment, or a return type with paths ending without a return, are not translated and the Python
+    function is used.
+
+    Ints are C longs and do not grow beyond 64 bits. Division and modulo by a value that is not a non zero
+    constant raise ZeroDivisionError, and functions using them hold the GIL while running. As with
+    cc_build, array writes are only seen by the caller when a ctypes array, MappedArray or buffer is
+    passed. When code is given it is compiled as C by CC_Builder instead. The CC_Config options apply as
+    for CC_Builder.
+    """
+
+    def __init__(self, code, config=None):
+        self.config = config if config else CC_Config()
+        BaseBuilder.__init__(self, code, config)
+
+    def compile(self, fun):
+        if self.code:
+            return CC_Builder(self.code, self.config).compile(fun)
+        translator = Translator(fun, inspect.signature(fun))
+        try:
+            code, sig = translator.translate()
+        except (Unsupported, OSError, SyntaxError) as e:
+            logger.info(f'Not translating {fun.__name__}, unsupported: {e}')
+            return None
+        logger.debug(f'Translated {fun.__name__}:\n{code}')
+        # a copy of the function with the ctypes hints CC_Builder expects
+        hinted = types.FunctionType(fun.__code__, fun.__globals__, fun.__name__,
+                                    fun.__defaults__, fun.__closure__)
+        hinted.__module__ = fun.__module__
+        hinted.__signature__ = sig
+        config = deepcopy(self.config)
+        config.shared_libs = [*config.shared_libs, 'm']
+        if translator.divides:
+            # raising ZeroDivisionError needs the GIL and the interpreter's symbols
+            config.gil = 'hold'
+            if sys.platform == 'darwin':
+                config.compiler_opts = [*config.compiler_opts, '-undefined', 'dynamic_lookup']
+        return CC_Builder(code, config).compile(hinted)
@@ -1,10 +1,22 @@
+import asyncio
 import ctypes
+import glob
+import json
+import mmap
 import subprocess
+import sys
+import textwrap
+import threading
+import time
+import typing
 import pytest
+import shutil
 import os
 import pathlib
+import platform
 from pytest_mock import mocker
-from loial.builders.cc_builder import CC_Builder, CC_Config, AsPointer, AsRef, C_Struct, cc_build, c_struct
+from loial.builders import cc_prototype
+from loial.builders.cc_builder import _encode, CC_Builder, CC_Config, AsPointer, AsRef, MappedArray, C_Struct, C_Columns, cc_build, c_struct, c_columns, libraries, metrics, watcher
 
 
 @pytest.fixture(autouse=True)
@@ -779,3 +791,1350 @@ def test_build_replace_function_body_auto_callback_function():
         return a-b
 
     assert cbfun(1, 1, cb) == 20
+
+
+def test_build_replace_function_body_struct_array_args():
+
+    @c_struct
+    class Point():
+        x: ctypes.c_int
+        y: ctypes.c_int
+
+    @cc_build(Point.define() + '''
+    int total(Point *points, int n) {
+        int i;
+        int sum = 0;
+        for(i=0; i<n; i++)
+        {
+            sum = sum + points[i].x * points[i].y;
+            points[i].x = -1;
+        }
+        return sum;
+    }
+    ''')
+    def total(points, n):
+        return sum(p.x * p.y for p in points)
+
+    points = [Point(1, 2), Point(3, 4), Point(5, 6)]
+    assert total(points, 3) == 44
+
+    arr = Point.array(points)
+    assert total(arr, 3) == 44
+    assert [p.x for p in arr] == [-1, -1, -1]
+
+    buffer = bytearray(ctypes.sizeof(Point) * 2)
+    view = Point.view(buffer)
+    view[0].x, view[0].y = 2, 3
+    view[1].x, view[1].y = 4, 5
+    assert total(view, 2) == 26
+    assert Point.from_buffer(buffer).x == -1
+
+
+def test_struct_define_nested_dependency_order():
+
+    @c_struct
+    class Inner():
+        a: ctypes.c_short
+        b: ctypes.c_double * 2
+
+    @c_struct
+    class Middle():
+        inner: Inner
+        next: ctypes.POINTER(Inner)
+
+    @c_struct
+    class Outer():
+        middles: Middle * 3
+        c: ctypes.c_int
+
+    define = Outer.define()
+    assert define.index('} Inner;') < define.index('} Middle;') < define.index('} Outer;')
+    assert 'double b[2]' in define
+    assert 'Inner *next' in define
+    assert 'Middle middles[3]' in define
+
+    @cc_build(Inner.define() + Outer.define() + '''
+    int outer_size() {
+        return sizeof(Outer);
+    }
+    ''')
+    def outer_size():
+        return 0
+
+    assert outer_size() == ctypes.sizeof(Outer)
+
+
+def test_struct_define_packed():
+
+    class Packed(C_Struct):
+        _pack_ = 1
+        _fields_ = [("a", ctypes.c_char),
+                    ("b", ctypes.c_int)]
+
+    @cc_build(Packed.define() + '''
+    int packed_size() {
+        return sizeof(Packed);
+    }
+    ''')
+    def packed_size():
+        return 0
+
+    assert packed_size() == ctypes.sizeof(Packed) == 5
+
+
+def test_build_replace_function_body_columns_args():
+
+    @c_columns
+    class Trades():
+        price: ctypes.c_double
+        size: ctypes.c_int
+
+    assert issubclass(Trades, C_Columns)
+    assert Trades._record_.__name__ == 'TradesRow'
+    assert 'double *price' in Trades.define()
+    assert ' length;' in Trades.define()
+
+    @cc_build(Trades.define() + r'''
+    #include <stddef.h>
+    double notional(Trades t) {
+        double total = 0;
+        for (size_t i = 0; i < t.length; i++) {
+            total += t.price[i] * t.size[i];
+            t.size[i] = 0;
+        }
+        return total;
+    }
+    ''')
+    def notional(t) -> ctypes.c_double:
+        return sum(row.price * row.size for row in t)
+
+    trades = Trades.from_rows([(10.5, 2), (11.0, 3)])
+    assert len(trades) == 2
+    assert trades[1].price == 11.0
+    assert trades[-1].size == 3
+
+    trades[0] = (10.0, 4)
+    trades.set_column('price', [1.5, 2.5])
+    assert list(trades.column('price')) == [1.5, 2.5]
+    assert notional(trades) == 13.5
+    assert list(trades.column('size')) == [0, 0]
+
+    with pytest.raises(IndexError):
+        trades[2]
+
+
+def test_columns_from_struct():
+
+    @c_struct
+    class Sample():
+        value: ctypes.c_float
+
+    SampleColumns = c_columns(Sample)
+    assert SampleColumns.__name__ == 'SampleColumns'
+
+    columns = SampleColumns(3)
+    columns[2] = Sample(4.0)
+    assert [row.value for row in columns] == [0.0, 0.0, 4.0]
+    assert columns.value[2] == 4.0
+
+    with pytest.raises(ValueError):
+        @c_columns
+        class Bad():
+            length: ctypes.c_int
+
+
+def test_build_replace_function_body_mapped_file_args(tmp_path):
+
+    data_file = tmp_path / 'values.bin'
+    data_file.write_bytes(bytes((ctypes.c_int * 4)(1, 2, 3, 4)))
+
+    @cc_build('''
+    #include <stddef.h>
+    long total(int *data, size_t n) {
+        long sum = 0;
+        for (size_t i = 0; i < n; i++) {
+            sum += data[i];
+            data[i] = 0;
+        }
+        return sum;
+    }
+    ''', CC_Config(mapped={'data': 'c'}, lengths={'n': 'data'}))
+    def total(data: ctypes.c_int, n) -> ctypes.c_long:
+        return sum(data)
+
+    with MappedArray(data_file, ctypes.c_int, mode='c') as data:
+        assert len(data) == 4
+        assert total(data) == 10
+        assert bytes(data.mmap) == bytes(16)
+    assert data_file.read_bytes() == bytes((ctypes.c_int * 4)(1, 2, 3, 4))
+
+    assert total(str(data_file)) == 10
+    assert total(str(data_file), 2) == 3
+
+    with MappedArray(data_file, ctypes.c_int, mode='w') as data:
+        assert total(data) == 10
+    assert data_file.read_bytes() == bytes(16)
+
+
+def test_build_replace_function_body_mapped_read_only(tmp_path):
+
+    data_file = tmp_path / 'values.bin'
+    data_file.write_bytes(bytes((ctypes.c_double * 3)(1.5, 2.5, 3.0)))
+
+    @cc_build('''
+    #include <stddef.h>
+    double mean(const double *data, size_t n) {
+        double sum = 0;
+        for (size_t i = 0; i < n; i++)
+            sum += data[i];
+        return sum / n;
+    }
+    ''', CC_Config(lengths={'n': 'data'}))
+    def mean(data: ctypes.c_double, n) -> ctypes.c_double:
+        return sum(data) / n
+
+    with open(data_file, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    assert mean(mapping) == 7 / 3
+    assert mean(MappedArray(mapping)) == 7 / 3
+    mapping.close()
+
+    with pytest.raises(ValueError):
+        MappedArray(data_file, mode='x')
+
+
+def test_build_replace_function_body_mapped_file_larger_than_memory_limit(tmp_path):
+
+    size = 96 * 1024 * 1024
+    data_file = tmp_path / 'large.bin'
+    with open(data_file, 'wb') as f:
+        f.truncate(size)
+        f.write(bytes(ctypes.c_int(7)))
+        f.seek(size - ctypes.sizeof(ctypes.c_int))
+        f.write(bytes(ctypes.c_int(5)))
+
+    script = textwrap.dedent(f'''
+        import ctypes
+        import resource
+        from loial.builders.cc_builder import CC_Config, cc_build
+
+        limit = 48 * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+        try:
+            bytearray({size})
+        except MemoryError:
+            pass
+        else:
+            raise SystemExit('memory limit not applied')
+
+        @cc_build(\'\'\'
+        #include <stddef.h>
+        long large(const int *data, size_t n) {{
+            long sum = 0;
+            for (size_t i = 0; i < n; i++)
+                sum += data[i];
+            return sum;
+        }}
+        \'\'\', CC_Config(mapped={{'data'}}, lengths={{'n': 'data'}}, cache_search_path=[{str(tmp_path)!r}]))
+        def large(data: ctypes.c_int, n) -> ctypes.c_long:
+            return -1
+
+        print(large({str(data_file)!r}))
+        ''')
+    out = subprocess.run([sys.executable, '-c', script], text=True, capture_output=True,
+                         cwd=pathlib.Path(__file__).parent.parent)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip() == '12'
+
+
+def test_build_replace_function_body_text_args():
+
+    @cc_build('''
+    #include <stddef.h>
+    size_t count(const char *text, size_t n, char c) {
+        size_t found = 0;
+        for (size_t i = 0; i < n; i++)
+            if (text[i] == c)
+                found++;
+        return found;
+    }
+    ''', CC_Config(lengths={'n': 'text'}))
+    def count(text: ctypes.c_char_p, n, c: ctypes.c_char) -> ctypes.c_size_t:
+        return text[:n].count(c)
+
+    assert count(b'a,b,c', c=b',') == 2
+    assert count(bytearray(b'a,b,c,'), c=b',') == 3
+    assert count(memoryview(b',,a,b,,')[2:5], c=b',') == 1
+    _encode.cache_clear()
+    assert count('é,é', c=b'\xc3') == 2
+    assert count('é,é', c=b'\xc3') == 2
+    # the length and the argument of each call share the cached bytes
+    assert _encode.cache_info().misses == 1
+    assert _encode.cache_info().hits == 3
+    assert count(b'a,b,c', 2, b',') == 1
+
+
+def test_build_list_default():
+    @cc_build('''
+    int sum_default(int *a, int n) {
+        int total = 0;
+        for (int i = 0; i < n; i++)
+            total += a[i];
+        return total;
+    }
+    ''')
+    def sum_default(a: ctypes.c_int = [1, 2, 3], n=3):
+        return sum(a[:n])
+
+    assert isinstance(sum_default.callable, CC_Builder)
+    assert sum_default() == 6
+
+def test_build_replace_function_body_bytearray_shared():
+
+    @cc_build('''
+    void upper(char *text, int n) {
+        for (int i = 0; i < n; i++)
+            if (text[i] >= 'a' && text[i] <= 'z')
+                text[i] -= 32;
+    }
+    ''')
+    def upper(text: ctypes.c_char_p, n):
+        return text.upper()
+
+    text = bytearray(b'abc,def')
+    upper(memoryview(text)[4:], 3)
+    assert text == b'abc,DEF'
+
+
+def test_build_replace_function_body_pooled_args():
+
+    @cc_build('''
+    int pooled(int a[], int n, int *total, int *scale) {
+        int sum = 0;
+        for (int i = 0; i < n; i++)
+            sum += a[i];
+        *total = sum * *scale;
+        return sum;
+    }
+    ''', CC_Config(pool=True))
+    def pooled(a: ctypes.c_int, n, total: ctypes.c_int, scale: ctypes.c_int):
+        return sum(a)
+
+    total = AsPointer(0)
+    assert pooled([1, 2, 3], 3, total, AsRef(2)) == 6
+    assert total.value == 12
+    assert pooled([4, 5, 6], 3, total, AsRef(3)) == 15
+    assert total.value == 45
+    assert pooled([1, 2], 2, total, AsRef(1)) == 3
+    assert total.value == 3
+
+    builder = pooled.callable
+    first = builder.build_args([1, 2, 3], 3, AsPointer(0), AsRef(1))
+    second = builder.build_args([7, 8, 9], 3, AsPointer(0), AsRef(1))
+    assert first[0] is second[0]
+    assert first[2] is second[2]
+    assert list(second[0]) == [7, 8, 9]
+
+    other = []
+    thread = threading.Thread(target=lambda: other.extend(
+        builder.build_args([1, 2, 3], 3, AsPointer(0), AsRef(1))))
+    thread.start()
+    thread.join()
+    assert other[0] is not first[0]
+
+
+def test_parse_c_signature():
+
+    code = r'''
+    #include <stdio.h>
+    /* int hidden(int a); */
+    static const char *label = "skip(int a);";
+    typedef struct { int a; } Pair;
+
+    static inline unsigned long long parse(const char *text, int values[], double **out,
+                                           float (*cb)(int, int), unsigned n, Pair p) {
+        return helper(n);
+    }
+    void nothing(void);
+    int varargs(int n, ...);
+    '''
+
+    restype, argtypes = cc_prototype.c_signature(
+        [code], 'parse', {'Pair': ctypes.c_int})
+    assert restype is ctypes.c_ulonglong
+    assert argtypes == [ctypes.c_char_p, ctypes.POINTER(ctypes.c_int),
+                        ctypes.POINTER(ctypes.POINTER(ctypes.c_double)),
+                        ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    assert cc_prototype.c_signature([code], 'parse')[1] is None
+    assert cc_prototype.c_signature([code], 'nothing') == (None, [])
+    assert cc_prototype.c_signature([code], 'varargs') == (ctypes.c_int, None)
+    assert cc_prototype.c_signature([code], 'helper') is None
+    assert cc_prototype.c_signature([code], 'hidden') is None
+    assert cc_prototype.c_signature([code], 'skip') is None
+
+
+def test_build_replace_function_body_parsed_signature():
+
+    @cc_build(r'''
+    #include <string.h>
+    double scale(double x, float f, const char *text) {
+        return x * f + strlen(text);
+    }
+    ''')
+    def scale(x, f, text):
+        return 0
+
+    assert scale(1.5, 2.0, 'abc') == 6.0
+    assert scale.callable.function.restype is ctypes.c_double
+    assert scale.callable.function.argtypes == [
+        ctypes.c_double, ctypes.c_float, ctypes.c_char_p]
+
+    @cc_build('''
+    void nothing(int a) {
+    }
+    ''')
+    def nothing(a):
+        return a
+
+    assert nothing(1) is None
+
+
+def test_build_replace_function_body_parsed_header_signature():
+
+    header = CC_Config().create_cache_path('half.h')
+    with open(header, 'w') as out:
+        out.write('float half(float a);\n')
+
+    src_file = CC_Config().create_cache_path('half.c')
+    with open(src_file, 'w') as out:
+        out.write('''
+                  #include "half.h"
+                  float half(float a) {
+                      return a / 2;
+                  }
+                  ''')
+
+    @cc_build('''
+    #include "half.h"
+    ''', CC_Config(src_files=[src_file], includes=[CC_Config().cache]))
+    def half(a):
+        return a
+
+    assert half(3) == 1.5
+
+
+def test_build_gil_policy():
+
+    code = '''
+    int gil(int a) {
+        return a * 2;
+    }
+    '''
+
+    @cc_build(code, CC_Config(gil='hold'))
+    def gil(a):
+        return a
+
+    assert isinstance(gil.callable.main, ctypes.PyDLL)
+    assert not gil.callable.releases_gil
+    assert gil(2) == 4
+    assert asyncio.run(gil.async_call(3)) == 6
+
+    @cc_build(code)
+    def gil(a):
+        return a
+
+    assert not isinstance(gil.callable.main, ctypes.PyDLL)
+    assert gil.callable.releases_gil
+    assert gil(2) == 4
+
+    with pytest.raises(ValueError):
+        cc_build(code, CC_Config(gil='maybe'))
+
+
+def test_build_async_call_overlaps():
+
+    @cc_build('''
+    #include <unistd.h>
+    int nap(int ms) {
+        usleep(ms * 1000);
+        return ms;
+    }
+    ''')
+    def nap(ms):
+        return ms
+
+    async def naps():
+        return await asyncio.gather(nap.async_call(200), nap.async_call(ms=200))
+
+    start = time.perf_counter()
+    assert asyncio.run(naps()) == [200, 200]
+    assert time.perf_counter() - start < 0.35
+
+
+def test_build_memoize():
+
+    @cc_build('''
+    int memo(int a, int b) {
+        return a * b;
+    }
+    ''', memoize=True)
+    def memo(a, b):
+        return a + b
+
+    assert memo(2, 3) == 6
+    assert memo(2, b=3) == 6
+    assert memo.cache_info().hits == 1
+    assert memo(ctypes.c_int(2), 3) == 6
+    assert memo.cache_info().misses == 1
+    assert memo(2, 4) == 8
+    assert memo.cache_info() == (1, 2, 128, 2)
+
+
+def test_build_compiler_launcher(mocker, tmp_path, monkeypatch):
+
+    launcher = tmp_path / 'bin' / 'ccache'
+    launcher.parent.mkdir()
+    launcher.write_text(f'''#!/bin/sh
+if [ -e "{tmp_path}/seen" ]; then
+    echo direct_cache_hit >> "$CCACHE_STATSLOG"
+else
+    touch "{tmp_path}/seen"
+    echo cache_miss >> "$CCACHE_STATSLOG"
+fi
+exec "$@"
+''')
+    launcher.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{launcher.parent}{os.pathsep}{os.environ["PATH"]}')
+    metrics.reset()
+    spy = mocker.spy(subprocess, 'run')
+
+    code = '''
+    int launch(int a) {
+        return a * 3;
+    }
+    '''
+
+    @cc_build(code, CC_Config(launcher='auto'))
+    def launch(a):
+        return a
+
+    assert launch(2) == 6
+    cmd = spy.call_args_list[0].args[0]
+    assert cmd[0] == str(launcher)
+    assert '-c' in cmd and '-shared' not in cmd
+    assert not os.path.isabs(cmd[cmd.index('-o') + 1])
+    assert spy.call_args_list[0].kwargs['cwd'] == str(CC_Config().cache)
+    link = spy.call_args_list[1].args[0]
+    assert link[0] == 'cc' and '-shared' in link
+    assert metrics.compiles == 1
+
+    launch.callable.clean()
+
+    @cc_build(code, CC_Config(launcher='auto'))
+    def launch(a):
+        return a
+
+    assert launch(2) == 6
+    assert metrics.as_dict()['launcher_hits'] == 1
+    assert metrics.compiles == 1
+    assert not glob.glob(f'{CC_Config().cache}/*.stats')
+
+    @cc_build('junk', CC_Config(launcher=str(launcher)))
+    def launch(a):
+        return a
+
+    assert launch(2) == 2
+    assert metrics.failures == 1
+
+
+
+def test_build_launcher_language_option():
+    @cc_build('''
+    int language(int a) {
+        return a * 4;
+    }
+    ''', CC_Config(launcher='env', compiler_opts=('-fPIC', '-shared', '-xc')))
+    def language(a):
+        return a
+
+    assert isinstance(language.callable, CC_Builder)
+    assert language(2) == 8
+
+@pytest.mark.skipif(not shutil.which('ccache'), reason='ccache not installed')
+def test_build_ccache(tmp_path, monkeypatch):
+    monkeypatch.setenv('CCACHE_DIR', str(tmp_path / 'ccache'))
+    metrics.reset()
+    code = '''
+    int cached(int a) {
+        return a * 5;
+    }
+    '''
+
+    for _ in range(2):
+        @cc_build(code, CC_Config(launcher='ccache'))
+        def cached(a):
+            return a
+
+        assert cached(2) == 10
+        cached.callable.unload()
+        cached.callable.clean()
+
+    assert metrics.compiles == 1
+    assert metrics.as_dict()['launcher_hits'] == 1
+
+
+def test_build_precompiled_prelude(mocker, tmp_path):
+
+    (tmp_path / 'heavy.h').write_text('''
+    #define HEAVY_SCALE 7
+    static inline int heavy(int a) { return a * HEAVY_SCALE; }
+    ''')
+    config = CC_Config(prelude='#include "heavy.h"\n', includes=[tmp_path],
+                       compiler_opts=('-fPIC', '-shared', '-H'))
+    spy = mocker.spy(subprocess, 'run')
+
+    @cc_build('''
+    int pre1(int a) {
+        return heavy(a);
+    }
+    ''', config)
+    def pre1(a):
+        return a
+
+    assert pre1(2) == 14
+    pch = glob.glob(f'{CC_Config().cache}/pch/*/loial_prelude.h.[gp]ch')
+    assert len(pch) == 1
+    assert f'! {pch[0]}' in spy.spy_return.stderr or CC_Builder.is_clang(config.compiler)
+    compiles = spy.call_count
+
+    @cc_build('''
+    int pre2(int a) {
+        return heavy(a) + HEAVY_SCALE;
+    }
+    ''', config)
+    def pre2(a):
+        return a
+
+    assert pre2(2) == 21
+    assert spy.call_count == compiles + 1
+    assert '-include' in spy.call_args.args[0] or '-include-pch' in spy.call_args.args[0]
+
+    config.prelude = '#include "heavy.h"\n#define EXTRA 1\n'
+
+    @cc_build('''
+    int pre3(int a) {
+        return heavy(a) + EXTRA;
+    }
+    ''', config)
+    def pre3(a):
+        return a
+
+    assert pre3(2) == 15
+    assert len(glob.glob(f'{CC_Config().cache}/pch/*/loial_prelude.h.[gp]ch')) == 2
+
+
+def test_build_precompiled_prelude_header_changed(tmp_path):
+    header = tmp_path / 'value.h'
+    header.write_text('#define VALUE 1\n')
+    config = CC_Config(prelude='#include "value.h"\n', includes=[tmp_path])
+
+    @cc_build('''
+    int value1(void) {
+        return VALUE;
+    }
+    ''', config)
+    def value1():
+        ...
+
+    assert value1() == 1
+    header.write_text('#define VALUE 2\n')
+    os.utime(header, ns=(0, 1))
+
+    @cc_build('''
+    int value2(void) {
+        return VALUE;
+    }
+    ''', config)
+    def value2():
+        ...
+
+    assert value2() == 2
+    assert len(glob.glob(f'{CC_Config().cache}/pch/*/loial_prelude.h.[gp]ch')) == 2
+
+def test_build_failed_build_not_retried(mocker):
+
+    spy = mocker.spy(subprocess, 'run')
+
+    @cc_build('junk')
+    def junk(a):
+        return a + 1
+
+    assert junk(1) == 2
+    assert spy.call_count == 1
+    assert len(glob.glob(f'{CC_Config().cache}/*.failed')) == 1
+
+    @cc_build('junk')
+    def junk(a):
+        return a + 1
+
+    assert junk(1) == 2
+    assert spy.call_count == 1
+
+    @cc_build('junk', CC_Config(compiler_opts=('-fPIC', '-shared', '-O2')))
+    def junk(a):
+        return a + 1
+
+    assert junk(1) == 2
+    assert spy.call_count == 2
+
+
+def test_build_failed_build_retried_when_input_changes(mocker):
+
+    src_file = CC_Config().create_cache_path('retry.c')
+    with open(src_file, 'w') as out:
+        out.write('junk')
+
+    spy = mocker.spy(subprocess, 'run')
+
+    def retry(a):
+        return a
+
+    assert cc_build(config=CC_Config(src_files=[src_file]))(retry)(3) == 3
+    assert cc_build(config=CC_Config(src_files=[src_file]))(retry)(3) == 3
+    assert spy.call_count == 1
+
+    with open(src_file, 'w') as out:
+        out.write('int retry(int a) { return a * 5; }')
+    os.utime(src_file, ns=(0, 1))
+
+    assert cc_build(config=CC_Config(src_files=[src_file]))(retry)(3) == 15
+    assert spy.call_count == 2
+
+
+def test_build_missing_compiler(mocker):
+
+    spy = mocker.spy(subprocess, 'run')
+
+    @cc_build('''
+    int missing_cc(int a) {
+        return a * 2;
+    }
+    ''', CC_Config(compiler='loial-missing-cc'))
+    def missing_cc(a):
+        return a
+
+    assert missing_cc(3) == 3
+    spy.assert_not_called()
+    assert not CC_Builder.compiler_available(CC_Config(compiler='loial-missing-cc'))
+    assert CC_Builder.compiler_available(CC_Config())
+    output = CC_Config().create_cache_path('missing_cc.so')
+    assert CC_Builder.cc_compile('int a;', output, CC_Config(compiler='loial-missing-cc')) is None
+
+
+def test_build_shared_library_reference_counted():
+    code = '''
+    int shared_lib(int a) {
+        return a + 1;
+    }
+    '''
+
+    def shared_lib(a):
+        return a
+
+    first = cc_build(code)(shared_lib)
+    second = cc_build(code)(shared_lib)
+    so_file = first.callable.so_file
+
+    assert first.callable.main is second.callable.main
+    assert libraries.count(so_file) == 2
+
+    first.callable.unload()
+    assert libraries.count(so_file) == 1
+    assert second(1) == 2
+    with pytest.raises(RuntimeError):
+        first(1)
+
+    second.callable.unload()
+    assert libraries.count(so_file) == 0
+    with open('/proc/self/maps') as maps:
+        assert os.path.abspath(so_file) not in maps.read()
+
+
+def test_build_watch_src_files():
+    src_file = CC_Config().create_cache_path('watched.c')
+    with open(src_file, 'w') as out:
+        out.write('int watched(int a) { return a * 2; }')
+
+    @cc_build(config=CC_Config(src_files=[src_file], watch=True), memoize=True)
+    def watched(a):
+        return a
+
+    assert watched(3) == 6
+    first = watched.callable
+    assert watcher.poll() == 0
+
+    with open(src_file, 'w') as out:
+        out.write('int watched(int a) { return a * 3; }')
+    os.utime(src_file, ns=(0, 1))
+
+    watcher.poll()
+    assert watched(3) == 9
+    assert watched.callable is not first
+    assert watched.callable.so_file.endswith('.r1.so')
+    assert watcher.poll() == 0
+
+
+def test_build_watch_inline_code(tmp_path, monkeypatch):
+    module = tmp_path / 'watched_inline.py'
+    source = textwrap.dedent('''
+    from loial.builders.cc_builder import CC_Config, cc_build
+
+    @cc_build(\'\'\'
+    int watched_inline(int a) {
+        return a + 1;
+    }
+    \'\'\', CC_Config(watch=True))
+    def watched_inline(a):
+        return a
+    ''')
+    module.write_text(source)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    import watched_inline
+
+    assert watched_inline.watched_inline(1) == 2
+
+    module.write_text(source + '\n# an unrelated edit\n')
+    os.utime(module, ns=(0, 1))
+    assert watcher.poll() == 0
+
+    module.write_text(source.replace('a + 1', 'a + 10'))
+    os.utime(module, ns=(0, 2))
+    watcher.poll()
+    assert watched_inline.watched_inline(1) == 11
+
+    module.write_text(source.replace('a + 1', 'a +'))
+    os.utime(module, ns=(0, 3))
+    assert watcher.poll() == 0
+    assert watched_inline.watched_inline(1) == 11
+    del sys.modules['watched_inline']
+
+
+def test_build_watch_inline_expression(tmp_path, monkeypatch, caplog):
+    module = tmp_path / 'watched_expression.py'
+    source = textwrap.dedent('''
+    from loial.builders.cc_builder import CC_Config, cc_build
+
+    STEP = '#define STEP 1\\n'
+
+    @cc_build(STEP + f\'\'\'
+    int watched_expression(int a) {{
+        return a * {2} + STEP;
+    }}
+    \'\'\', CC_Config(watch=True))
+    def watched_expression(a):
+        return a
+
+    def local_code():
+        code = 'int watched_local(int a) { return a; }'
+
+        @cc_build(code, CC_Config(watch=True))
+        def watched_local(a):
+            return a
+        return watched_local
+    ''')
+    module.write_text(source)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    import watched_expression
+
+    assert watched_expression.watched_expression(3) == 7
+    module.write_text(source.replace('{2}', '{3}'))
+    os.utime(module, ns=(0, 1))
+    watcher.poll()
+    assert watched_expression.watched_expression(3) == 10
+
+    assert watched_expression.local_code()(3) == 3
+    assert 'Unable to re-read the inline code of watched_local' in caplog.text
+    del sys.modules['watched_expression']
+
+def test_build_pool_map():
+    from loial.builders.cc_pool import SharedArray
+
+    @cc_build('''
+    double pool_sum(const double *values, long start, long n, double *out, long slot) {
+        double total = 0;
+        for (long i = start; i < start + n; i++)
+            total += values[i];
+        out[slot] = total;
+        return total;
+    }
+    ''', CC_Config(gil='hold'))
+    def pool_sum(values: ctypes.c_double, start, n, out: ctypes.c_double, slot):
+        ...
+
+    with SharedArray(ctypes.c_double, range(100)) as values, SharedArray(ctypes.c_double, length=4) as out:
+        results = pool_sum.pool_map((values, i * 25, 25, out, i) for i in range(4))
+        expected = [sum(range(i * 25, i * 25 + 25)) for i in range(4)]
+        assert results == expected
+        assert list(out) == expected
+
+    assert pool_sum.pool_map([([1.0, 2.0], 0, 2, [0.0], 0)]) == [3.0]
+    with pytest.raises(TypeError):
+        pool_sum.pool_map([([1.0], 0, 1, AsPointer(0.0), 0)])
+
+
+def test_build_pool_map_python_fallback():
+    @cc_build(replace=False)
+    def pool_python(a, b=1):
+        return a + b
+
+    assert pool_python.pool_map([(1, 2), 3]) == [3, 4]
+
+
+def test_build_struct_return():
+    @c_struct
+    class ReturnedPoint():
+        x: ctypes.c_double
+        y: ctypes.c_double
+
+    @cc_build(ReturnedPoint.define() + '''
+    ReturnedPoint midpoint(ReturnedPoint a, ReturnedPoint b) {
+        ReturnedPoint m = {(a.x + b.x) / 2, (a.y + b.y) / 2};
+        return m;
+    }
+    ''')
+    def midpoint(a, b) -> ReturnedPoint:
+        ...
+
+    m = midpoint(ReturnedPoint(0, 0), ReturnedPoint(2, 4))
+    assert isinstance(m, ReturnedPoint)
+    assert (m.x, m.y) == (1.0, 2.0)
+
+
+class Bounds(typing.NamedTuple):
+    lo: ctypes.c_double
+    hi: ctypes.c_double
+    count: ctypes.c_long
+
+
+def test_build_tuple_return():
+    code = '''
+    void minmax(const double *a, long n, double *lo, double* hi, long *count) {
+        *lo = *hi = a[0];
+        for (long i = 1; i < n; i++) {
+            if (a[i] < *lo) *lo = a[i];
+            if (a[i] > *hi) *hi = a[i];
+        }
+        *count = n;
+    }
+    '''
+
+    @cc_build(code)
+    def minmax(a: ctypes.c_double, n) -> tuple[ctypes.c_double, ctypes.c_double, ctypes.c_long]:
+        return min(a), max(a), n
+
+    @cc_build(code, CC_Config(function='minmax'))
+    def bounds(a: ctypes.c_double, n) -> Bounds:
+        ...
+
+    assert isinstance(minmax.callable, CC_Builder)
+    assert minmax([3.0, 1.0, 2.0], 3) == (1.0, 3.0, 3)
+    assert bounds([3.0, 1.0, 2.0], 3) == Bounds(1.0, 3.0, 3)
+    assert bounds([3.0, 1.0, 2.0], 3).hi == 3.0
+
+
+def test_build_tuple_return_restrict():
+    @cc_build('''
+    void spread(const double *restrict a, long n, double *restrict lo, volatile double * __restrict hi) {
+        *lo = a[0];
+        *hi = a[n - 1];
+    }
+    ''')
+    def spread(a: ctypes.c_double, n) -> tuple[ctypes.c_double, ctypes.c_double]:
+        return a[0], a[n - 1]
+
+    assert isinstance(spread.callable, CC_Builder)
+    assert spread([1.0, 2.0, 3.0], 3) == (1.0, 3.0)
+    assert not glob.glob(f'{CC_Config().cache}/*.failed')
+
+def test_build_tuple_return_mismatch():
+    @cc_build('''
+    void one_out(long a, long *out) {
+        *out = a;
+    }
+    ''')
+    def one_out(a) -> tuple[ctypes.c_double]:
+        return (-1.0,)
+
+    assert not isinstance(one_out.callable, CC_Builder)
+    assert one_out(3) == (-1.0,)
+
+
+def test_build_threads_stress():
+    code = '''
+    long stress(long a, long b) {
+        return a * b;
+    }
+    '''
+    threads = 8
+    barrier = threading.Barrier(threads)
+    errors = []
+    metrics.reset()
+
+    def run(index):
+        try:
+            barrier.wait()
+
+            @cc_build(code, CC_Config(pool=True))
+            def stress(a, b):
+                return 0
+
+            for i in range(1000):
+                assert stress(index, i) == index * i
+        except BaseException as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert errors == []
+    assert metrics.compiles == 1
+    assert not glob.glob(os.path.join(CC_Config().cache, '*.tmp'))
+
+
+def test_build_specialize():
+    @cc_build('''
+    long specialized(const long *a, long n, long scale, int twice) {
+        long total = 0;
+        for (long i = 0; i < n; i++)
+            total += a[i] * scale;
+    #ifdef LOIAL_SPECIALIZED
+        total += LOIAL_n * 1000;
+    #endif
+        return twice ? total * 2 : total;
+    }
+    ''', CC_Config(specialize=('n', 'twice'), max_variants=2, compiler_opts=['-fPIC', '-shared', '-O2']))
+    def specialized(a: ctypes.c_long, n, scale, twice=False):
+        ...
+
+    assert specialized([1, 2, 3], 3, 2) == 3012
+    assert specialized([1, 2, 3], 3, 2, True) == 6024
+    assert specialized([1, 2, 3], 3, 5) == 3030
+    assert len(specialized.callable.variants) == 2
+    # beyond max_variants the generic function is called
+    assert specialized([1, 2, 3], n=2, scale=1) == 3
+    assert len(specialized.callable.variants) == 2
+
+
+def test_build_specialize_double():
+    code = '''
+    double scale(double x, int n) {
+        return x * n;
+    }
+    '''
+    config = CC_Config(specialize=('n',), compiler_opts=['-fPIC', '-shared', '-O2'])
+
+    @cc_build(code, config)
+    def scale(x: ctypes.c_double, n: ctypes.c_int):
+        ...
+
+    assert scale(3.25, 2) == 6.5
+    assert scale.callable.variants[((int, 2),)] is not None
+
+    @cc_build(code, config)
+    def scale(x, n):
+        ...
+
+    assert scale(3.25, 2) == 6.5
+    assert scale.callable.variants[((int, 2),)] is not None
+
+
+def test_build_specialize_checks():
+    code = '''
+    long checked(long n) {
+    #if defined(LOIAL_SPECIALIZED) && LOIAL_n < 0
+    #error negative
+    #endif
+        return n * 2;
+    }
+    '''
+
+    @cc_build(code, CC_Config(specialize=('N',)))
+    def checked(n):
+        ...
+
+    assert checked(3) == 6
+    assert checked.callable.variants is None
+
+    @cc_build(code, CC_Config(specialize=('n',), max_variants=2))
+    def checked(n):
+        ...
+
+    # a variant failing to build calls the generic function and is not counted
+    assert checked(-1) == -2
+    assert checked.callable.variants == {((int, -1),): None}
+    assert checked(4) == 8
+    assert checked(5) == 10
+    assert checked.callable.variants[((int, 5),)] is not None
+    assert checked.callable.variant((float('nan'),), {}) is None
+    assert len(checked.callable.variants) == 3
+
+
+@pytest.mark.skipif(sys.platform == 'darwin', reason='lists exports with GNU nm')
+def test_build_minimal_so():
+    code = '''
+    static const double table[8192] = {1};
+
+    double lookup(long i) {
+        return table[i];
+    }
+
+    long twice(long a) {
+        return a * 2;
+    }
+
+    void halves(long a, long *lo, long *hi) {
+        *lo = a / 2;
+        *hi = a - a / 2;
+    }
+    '''
+
+    def exports(wrapper):
+        out = subprocess.run(['nm', '-D', '--defined-only', wrapper.callable.library_file],
+                             text=True, capture_output=True, check=True)
+        return {line.split()[-1] for line in out.stdout.splitlines() if line.split()[-2] in 'tT'}
+
+    @cc_build(code)
+    def twice(a):
+        ...
+
+    @cc_build(code, CC_Config(minimal_so=True))
+    def lookup(i) -> ctypes.c_double:
+        ...
+
+    @cc_build(code, CC_Config(minimal_so=True, function='halves'))
+    def split(a) -> tuple[ctypes.c_long, ctypes.c_long]:
+        ...
+
+    @cc_build(code, CC_Config(minimal_so=True, debug_symbols=True, function='twice'))
+    def debugged(a):
+        ...
+
+    assert lookup(0) == 1.0
+    assert list(lookup.stream([(0,), (1,)])) == [1.0, 0.0]
+    assert split(5) == (2, 3)
+    assert debugged(3) == 6
+    assert exports(twice) >= {'lookup', 'twice', 'halves'}
+    assert exports(lookup) == {'lookup'}
+    assert exports(split) == {'loial_call_halves'}
+    assert os.path.getsize(split.callable.library_file) < os.path.getsize(twice.callable.library_file) / 2
+    assert 'twice' in [name for name, _, _ in debugged.callable.symbols()]
+    assert not glob.glob(f'{CC_Config().cache}/*.map')
+
+
+def test_build_stable_source_path():
+    @cc_build('''
+    const char *source_path(void) {
+        return __FILE__;
+    }
+    ''')
+    def source_path() -> ctypes.c_char_p:
+        ...
+
+    path = source_path().decode()
+    assert path == f'{source_path.callable.so_file}.c'
+    assert os.path.exists(path)
+    source_path.callable.unload()
+    source_path.callable.clean()
+    assert not os.path.exists(path)
+
+def test_build_stale_libraries_removed():
+    def make(factor):
+        @cc_build(f'''
+        long stale(long n) {{
+            return n * {factor};
+        }}
+        ''', CC_Config(specialize=('n',)))
+        def stale(n):
+            ...
+        return stale
+
+    first = make(2)
+    assert first(3) == 6
+    first_files = glob.glob(f'{CC_Config().cache}/libtests.test_c_compiler.stale_*')
+    assert any(file.endswith('.so.c') for file in first_files)
+
+    # loaded libraries and the specialized variants are kept
+    second = make(3)
+    assert second(3) == 9
+    assert all(os.path.exists(file) for file in first_files)
+    assert glob.glob(f'{CC_Config().cache}/libtests.test_c_compiler.stale.variant_*.so')
+
+    first.callable.unload()
+    third = make(4)
+    assert third(3) == 12
+    assert not any(os.path.exists(file) for file in first_files)
+    assert os.path.exists(second.callable.library_file)
+
+def test_build_debug_symbols():
+    @cc_build('''
+    static long helper(long a) {
+        return a + 1;
+    }
+
+    long profiled(long a) {
+        return helper(a) * 2;
+    }
+    ''', CC_Config(debug_symbols=True, perf_map=True))
+    def profiled(a):
+        return a
+
+    assert profiled(1) == 4
+    builder = profiled.callable
+    with open(f'{builder.library_file}.symbols.json') as manifest_file:
+        manifest = json.load(manifest_file)
+    assert manifest['python'] == f'{__name__}.test_build_debug_symbols.<locals>.profiled'
+    assert manifest['source'].endswith(f'test_c_compiler.py:{profiled.callable.fun.__code__.co_firstlineno}')
+    names = {symbol['name']: symbol for symbol in manifest['symbols']}
+    assert names['profiled']['address'] == ctypes.cast(builder.function, ctypes.c_void_p).value
+    assert names['profiled']['size'] > 0
+    assert 'helper' in names
+    with open(builder.library_file, 'rb') as library:
+        assert b'.debug_info' in library.read()
+    with open(f'/tmp/perf-{os.getpid()}.map') as perf_map:
+        assert f'{names["profiled"]["address"]:x} ' in perf_map.read()
+    os.remove(f'/tmp/perf-{os.getpid()}.map')
+
+
+def test_build_opt_report(capsys):
+    @cc_build('''
+    static long helper(long a) {
+        return a + 1;
+    }
+
+    void reported(float *a, const float *b, long n) {
+        float scale = helper(n);
+        for (long i = 0; i < n; i++)
+            a[i] += b[i] * scale;
+    }
+
+    long chase(const long *next, long n) {
+        long i = 0, count = 0;
+        while (i >= 0 && count < n) {
+            i = next[i];
+            count++;
+        }
+        return count;
+    }
+    ''', CC_Config(opt_report=True, compiler_opts=['-fPIC', '-shared', '-O3']))
+    def reported(a, b, n):
+        ...
+
+    report = reported.opt_report
+    assert report['vectorized'] and report['vectorized'][0]['line'] == 8
+    assert 'file' not in report['vectorized'][0]
+    assert [entry['line'] for entry in report['missed']] == [14]
+    assert report['missed'][0]['reasons']
+    assert {(entry['callee'], entry['caller']) for entry in report['inlined']} == {('helper', 'reported')}
+
+    from loial.__main__ import main
+    assert main(['report', reported.callable.library_file]) == 0
+    out = capsys.readouterr().out
+    assert 'vectorized' in out and 'helper into reported' in out
+
+
+def test_remarks_clang():
+    from loial.builders import cc_remarks
+    report = cc_remarks.parse('''
+/tmp/a.so.1.tmp.c:4:5: remark: vectorized loop (vectorization width: 4, interleaved count: 2) [-Rpass=loop-vectorize]
+/tmp/a.so.1.tmp.c:9:5: remark: loop not vectorized [-Rpass-missed=loop-vectorize]
+/tmp/a.so.1.tmp.c:9:5: remark: loop not vectorized: could not determine number of loop iterations [-Rpass-analysis=loop-vectorize]
+values.h:2:12: remark: 'helper' inlined into 'reported' with (cost=-15, threshold=225) at callsite reported:2:5; [-Rpass=inline]
+''', '/tmp/a.so.1.tmp.c')
+    assert report['vectorized'][0]['line'] == 4
+    assert report['missed'] == [{'line': 9, 'column': 5, 'message': 'loop not vectorized',
+                                 'reasons': ['could not determine number of loop iterations']}]
+    assert report['inlined'][0]['file'] == 'values.h'
+    assert report['inlined'][0]['callee'] == 'helper'
+
+
+def test_build_cpu_variants(mocker):
+    from loial.builders.cc_builder import CPU_FEATURES
+    code = '''
+    long variant_sum(const long *a, long n) {
+        long total = 0;
+        for (long i = 0; i < n; i++)
+            total += a[i];
+        return total;
+    }
+    '''
+    config = CC_Config(cpu_variants=('x86-64-v4', 'x86-64-v3'),
+                       compiler_opts=['-fPIC', '-shared', '-O2'])
+
+    def variant_sum(a: ctypes.c_long, n):
+        return sum(a)
+
+    mocker.patch.object(CC_Builder, 'cpu_flags', set())
+    metrics.reset()
+    baseline = cc_build(code, config)(variant_sum)
+    assert baseline.callable.cpu_variant == 'baseline'
+    assert baseline([1, 2, 3], 3) == 6
+    assert metrics.compiles == 3
+    assert os.path.exists(baseline.callable.so_file.replace('.so', '.x86-64-v3.so'))
+
+    mocker.patch.object(CC_Builder, 'cpu_flags', CPU_FEATURES['x86-64-v3'])
+    v3 = cc_build(code, config)(variant_sum)
+    assert v3.callable.cpu_variant == 'x86-64-v3'
+    assert v3.callable.so_file.endswith('.x86-64-v3.so')
+    assert v3([1, 2, 3], 3) == 6
+    assert metrics.compiles == 3
+
+    if platform.machine() == 'x86_64':
+        assert CC_Builder.cpu_variants(CC_Config(cpu_variants=True)) == ['x86-64-v4', 'x86-64-v3', 'baseline']
+    assert CC_Builder.cpu_variants(CC_Config()) == ['baseline']
+
+
+def test_build_stream():
+    @cc_build('''
+    double streamed(long a, double b) {
+        return a * b;
+    }
+    ''')
+    def streamed(a, b=0.5):
+        return a * b
+
+    def records(n):
+        for i in range(n):
+            yield (i, 2.0) if i % 2 else (i,)
+
+    expected = [i * (2.0 if i % 2 else 0.5) for i in range(2500)]
+    results = streamed.stream(records(2500), chunk_size=1000)
+    assert next(results) == 0.0
+    assert [0.0, *results] == expected
+    assert list(streamed.stream(records(2500), chunk_size=1000, double_buffer=True)) == expected
+    assert streamed.callable.batch_function is not None
+
+    stopped = streamed.stream(records(10 ** 9), chunk_size=10, double_buffer=True)
+    assert next(stopped) == 0.0
+    stopped.close()
+
+
+def test_build_stream_fallback():
+    @cc_build('''
+    long stream_array(long *a, long n) {
+        return a[n - 1];
+    }
+    ''')
+    def stream_array(a: ctypes.c_long, n):
+        return a[n - 1]
+
+    @cc_build(replace=False)
+    def stream_python(a):
+        return a + 1
+
+    assert list(stream_array.stream([([1, 2], 2), ([3], 1)])) == [2, 3]
+    assert stream_array.callable.batch_function is None
+    assert list(stream_python.stream(range(3))) == [1, 2, 3]
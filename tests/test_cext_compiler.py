@@ -0,0 +1,228 @@
+import ctypes
+import glob
+import subprocess
+import pytest
+from pytest_mock import mocker
+from loial.builders.cc_builder import CC_Config
+from loial.builders.cext_builder import CExt_Builder, cext_build
+from loial import build
+
+
+@pytest.fixture(autouse=True)
+def auto():
+    temp_search_path = CC_Config.cache_search_path
+    CC_Config.cache_search_path = ['./.cache']
+    yield
+    CC_Config().clean_cache()
+    CC_Config.cache_search_path = temp_search_path
+
+
+def test_build_replace_function_body():
+    @cext_build('''
+    int ext1(int a, int b) {
+        return a * b;
+    }
+    ''')
+    def ext1(a, b):
+        return a + b
+
+    assert isinstance(ext1.callable, CExt_Builder)
+    assert ext1(3, 4) == 12
+
+
+def test_build_code_type():
+    @build('''
+    long ext2(long a) {
+        return a * 10;
+    }
+    ''', code_type='CExt')
+    def ext2(a):
+        return a
+
+    assert ext2(3) == 30
+
+
+def test_build_dont_replace_function_body():
+    @cext_build('''
+    int ext3(int a) {
+        return 10;
+    }
+    ''', replace=False)
+    def ext3(a):
+        return a
+
+    assert ext3(1) == 1
+
+
+def test_build_so_exists():
+    code = '''
+    int ext4(void) {
+        return 4;
+    }
+    '''
+
+    @cext_build(code)
+    def ext4():
+        return 1
+
+    assert ext4.callable.compiled
+
+    @cext_build(code)
+    def ext4():
+        return 1
+
+    assert not ext4.callable.compiled
+    assert ext4() == 4
+
+
+def test_build_parsed_and_hinted_types():
+    @cext_build('''
+    double ext5(double a, float b, unsigned long long c) {
+        return a * b + c;
+    }
+    ''')
+    def ext5(a, b, c):
+        return 0
+
+    assert ext5(1.5, 2.0, 2**40) == 3.0 + 2**40
+
+    @cext_build('''
+    float ext6(short a, float b) {
+        return a / b;
+    }
+    ''')
+    def ext6(a: ctypes.c_short, b: ctypes.c_float) -> ctypes.c_float:
+        return 0
+
+    assert ext6(3, 2.0) == 1.5
+
+
+def test_build_kwargs_and_defaults():
+    @cext_build('''
+    int ext7(int a, int b, int c) {
+        return (a - b) * c;
+    }
+    ''')
+    def ext7(a, b, c=2):
+        return 0
+
+    assert ext7(5, c=3, b=1) == 12
+    assert ext7(5, 1) == 8
+    with pytest.raises(TypeError):
+        ext7(5)
+
+
+def test_build_argument_errors():
+    @cext_build('''
+    int ext8(int a) {
+        return a;
+    }
+    ''')
+    def ext8(a):
+        return a
+
+    with pytest.raises(TypeError):
+        ext8('a')
+    with pytest.raises(TypeError):
+        ext8.callable.native(1, 2)
+
+
+def test_build_string_and_void():
+    @cext_build('''
+    #include <string.h>
+    static size_t seen;
+    size_t ext9(const char *text) {
+        seen = strlen(text);
+        return seen;
+    }
+    ''')
+    def ext9(text):
+        return 0
+
+    assert ext9('héllo') == 6
+    assert ext9(b'abc') == 3
+
+    @cext_build('''
+    void ext10(int a) {
+    }
+    ''')
+    def ext10(a):
+        return a
+
+    assert ext10(1) is None
+
+
+def test_build_unsupported_types_fall_back():
+    @cext_build('''
+    int ext11(int *a) {
+        return *a;
+    }
+    ''')
+    def ext11(a):
+        return a
+
+    assert ext11(3) == 3
+
+
+def test_build_compiler_error():
+    @cext_build('''
+        junk
+    ''')
+    def ext12(a: ctypes.c_int):
+        return a + 1
+
+    assert ext12(1) == 2
+
+
+def test_build_prelude():
+    @cext_build('''
+    int ext13(int a) {
+        return a * SCALE;
+    }
+    ''', CC_Config(prelude='#define SCALE 5\n'))
+    def ext13(a: ctypes.c_int) -> ctypes.c_int:
+        return a
+
+    assert isinstance(ext13.callable, CExt_Builder)
+    assert ext13(2) == 10
+
+
+def test_build_failed_build_not_retried(mocker):
+    spy = mocker.spy(subprocess, 'run')
+
+    for _ in range(2):
+        @cext_build('junk')
+        def ext14(a: ctypes.c_int):
+            return a + 1
+
+        assert ext14(1) == 2
+    assert spy.call_count == 1
+    assert len(glob.glob(f'{CC_Config().cache}/*.failed')) == 1
+
+
+def test_build_missing_compiler(mocker):
+    spy = mocker.spy(subprocess, 'run')
+
+    @cext_build('''
+    int ext15(int a) {
+        return a * 2;
+    }
+    ''', CC_Config(compiler='loial-missing-cc'))
+    def ext15(a: ctypes.c_int):
+        return a
+
+    assert ext15(3) == 3
+    spy.assert_not_called()
+
+
+def test_build_list_default():
+    @cext_build('''
+    int ext16(int a) {
+        return a + 1;
+    }
+    ''')
+    def ext16(a: ctypes.c_int, unused=[]):
+        return a
+
+    assert isinstance(ext16.callable, CExt_Builder)
+    assert ext16(1) == 2
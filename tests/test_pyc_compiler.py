@@ -0,0 +1,227 @@
+import ctypes
+import glob
+import math
+import pytest
+from loial.builders.cc_builder import CC_Builder, CC_Config
+from loial.builders.pyc_builder import pyc_build
+from loial import build
+
+SCALE = 3
+
+
+@pytest.fixture(autouse=True)
+def auto():
+    temp_search_path = CC_Config.cache_search_path
+    CC_Config.cache_search_path = ['./.cache']
+    yield
+    CC_Config().clean_cache()
+    CC_Config.cache_search_path = temp_search_path
+
+
+def test_build_translate_arrays():
+    @pyc_build()
+    def dot(a: list[float], b: list[float], n: int) -> float:
+        ''' The dot product.'''
+        total = 0.0
+        for i in range(n):
+            total += a[i] * b[i]
+        return total
+
+    assert isinstance(dot.callable, CC_Builder)
+    assert dot([1.0, 2.0, 3.0], [4.0, 5.0, 6.0], 3) == 32.0
+
+
+def test_build_code_type():
+    @build(code_type='PyC')
+    def scaled(a: int) -> int:
+        return a * SCALE
+
+    assert isinstance(scaled.callable, CC_Builder)
+    assert scaled(4) == 12
+
+
+def test_build_python_semantics():
+    @pyc_build()
+    def divide(a: int, b: int, x: float, y: float) -> float:
+        return (a // b) * 1000 + (a % b) * 100 + x // y + x % y + a / b
+
+    assert isinstance(divide.callable, CC_Builder)
+    for a, b in ((-7, 2), (7, -2), (7, 2), (-8, 2)):
+        assert divide(a, b, -7.5, 2.0) == divide.callable.fun(a, b, -7.5, 2.0)
+
+
+def test_build_control_flow():
+    @pyc_build()
+    def collatz(n: int, limit: int) -> int:
+        steps = 0
+        while n != 1:
+            if steps >= limit:
+                break
+            elif n % 2 == 0:
+                n = n // 2
+            else:
+                n = 3 * n + 1
+            steps += 1
+        return steps
+
+    assert isinstance(collatz.callable, CC_Builder)
+    assert collatz(27, 1000) == 111
+    assert collatz(27, 10) == 10
+
+
+def test_build_range_loops():
+    @pyc_build()
+    def last(n: int) -> int:
+        total = 0
+        i = -1
+        for i in range(n, 0, -2):
+            total += i
+        return total * 100 + i
+
+    assert isinstance(last.callable, CC_Builder)
+    assert last(7) == last.callable.fun(7) == 1601
+    assert last(0) == -1
+
+
+def test_build_array_write():
+    @pyc_build()
+    def fill(a: list[ctypes.c_int], n: int, value: ctypes.c_int):
+        for i in range(n):
+            a[i] = value + i
+
+    values = (ctypes.c_int * 3)()
+    fill(values, 3, 5)
+    assert list(values) == [5, 6, 7]
+
+
+def test_build_math():
+    @pyc_build()
+    def norm(x: float, y: float) -> float:
+        scale: float = max(abs(x), abs(y), 1)
+        return math.sqrt(x * x + y * y) / scale + math.floor(x) + min(x, y) + math.pi
+
+    assert isinstance(norm.callable, CC_Builder)
+    assert norm(3.0, -4.0) == pytest.approx(norm.callable.fun(3.0, -4.0))
+
+
+def test_build_unsupported_falls_back():
+    @pyc_build()
+    def digits(a: int) -> int:
+        return len(str(a))
+
+    @pyc_build()
+    def widen(a: int) -> float:
+        b = a
+        b = b / 2
+        return b
+
+    @pyc_build()
+    def untyped(a):
+        return a
+
+    assert not isinstance(digits.callable, CC_Builder)
+    assert not isinstance(widen.callable, CC_Builder)
+    assert not isinstance(untyped.callable, CC_Builder)
+    assert digits(123) == 3
+    assert widen(3) == 1.5
+
+
+def test_build_with_code():
+    @pyc_build('''
+    int with_code(int a) {
+        return a * 2;
+    }
+    ''')
+    def with_code(a):
+        return a
+
+    assert isinstance(with_code.callable, CC_Builder)
+    assert with_code(4) == 8
+
+
+def test_build_unchecked_constructs_fall_back():
+    @pyc_build()
+    def half(x: float) -> int:
+        return x / 2
+
+    @pyc_build()
+    def back(a: list[int], n: int) -> int:
+        i = n - 4
+        return a[i]
+
+    @pyc_build()
+    def log2(x: float) -> float:
+        return math.log(x, 2)
+
+    assert not isinstance(half.callable, CC_Builder)
+    assert not isinstance(back.callable, CC_Builder)
+    assert not isinstance(log2.callable, CC_Builder)
+    assert half(3.0) == 1.5
+    assert back([1, 2, 3], 3) == 3
+    assert log2(8.0) == pytest.approx(3.0)
+    assert not glob.glob(f'{CC_Config().cache}/*.failed')
+
+
+def test_build_loop_indexes():
+    @pyc_build()
+    def pairs(a: list[int], n: int) -> int:
+        total = 0
+        for i in range(n):
+            for j in range(i, n):
+                total += a[i + j * 0] * a[j]
+        for k in range(n - 1, 0, -1):
+            total += a[k]
+        return total
+
+    assert isinstance(pairs.callable, CC_Builder)
+    assert pairs([1, 2, 3], 3) == pairs.callable.fun([1, 2, 3], 3)
+
+
+def test_build_unassigned_paths_fall_back():
+    @pyc_build()
+    def sign(a: int) -> int:
+        if a > 0:
+            return 1
+        elif a < 0:
+            return -1
+
+    @pyc_build()
+    def pick(a: int) -> int:
+        if a > 0:
+            b = 5
+        return b
+
+    @pyc_build()
+    def both(a: int) -> int:
+        if a > 0:
+            b = 5
+        else:
+            b = 6
+        for i in range(a):
+            c = i
+        while a > 10:
+            if a > 20:
+                d = 1
+                break
+            a -= 1
+        return b
+
+    assert not isinstance(sign.callable, CC_Builder)
+    assert not isinstance(pick.callable, CC_Builder)
+    assert isinstance(both.callable, CC_Builder)
+    assert sign(0) is None
+    with pytest.raises(UnboundLocalError):
+        pick(0)
+    assert both(0) == 6
+
+
+def test_build_division_by_zero():
+    @pyc_build()
+    def divisions(a: int, b: int, x: float, y: float) -> float:
+        return a // b + a % b + a / b + x / y + x % y + x // y + a // 2
+
+    assert isinstance(divisions.callable, CC_Builder)
+    assert divisions(7, 2, 7.0, 2.0) == divisions.callable.fun(7, 2, 7.0, 2.0)
+    for args in ((7, 0, 1.0, 1.0), (7, 1, 1.0, 0.0)):
+        with pytest.raises(ZeroDivisionError):
+            divisions(*args)
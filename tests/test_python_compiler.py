@@ -1,5 +1,12 @@
+import asyncio
+import importlib.metadata
+import pathlib
+import subprocess
+import sys
+import time
 import pytest
-from loial import build
+from loial import build, Memoize, builders
+from loial.builders import BaseBuilder, get_builder
 
 def test_build_no_args_leaves_function_unchanged():
     @build()
@@ -43,3 +50,114 @@ def test_build_compile_error():
     def bad(x, y=0):
         return x + y
     assert bad(2, 5) == 7
+
+def test_build_async_call():
+    @build(code="return x * 10")
+    def aio(x):
+        return x + 1
+    assert asyncio.run(aio.async_call(3)) == 30
+
+def test_build_memoize():
+    @build(code="return x * y", memoize=2)
+    def mul(x, y=2):
+        return x + y
+
+    assert mul(3) == 6
+    assert mul(3, 2) == 6
+    assert mul(x=3) == 6
+    assert mul.cache_info() == (2, 1, 2, 1)
+    assert mul(4) == 8
+    assert mul(5) == 10
+    assert mul(3) == 6
+    assert mul.cache_info().misses == 4
+    assert mul([1], 2) == [1, 1]
+    assert mul.cache_info().misses == 4
+    mul.cache_clear()
+    assert mul.cache_info() == (0, 0, 2, 0)
+
+
+def test_build_memoize_ttl():
+    results = iter(range(10))
+
+    @build(memoize=Memoize(size=10, ttl=0.05))
+    def counter(x):
+        return next(results)
+
+    assert counter(1) == 0
+    assert counter(1) == 0
+    time.sleep(0.06)
+    assert counter(1) == 1
+    assert counter.cache_info().hits == 1
+
+
+def test_build_memoize_settings_not_shared():
+    settings = Memoize(size=4, ttl=60)
+
+    @build(memoize=settings)
+    def double(x):
+        return x * 2
+
+    @build(memoize=settings)
+    def triple(x):
+        return x * 3
+
+    assert triple(2) == 6
+    assert double(2) == 4
+    assert double.cache_info() == (0, 1, 4, 1)
+    assert settings.info() == (0, 0, 4, 0)
+
+
+def test_build_not_memoized():
+    @build(code="return x")
+    def plain(x):
+        return x + 1
+    assert plain.cache_info() is None
+
+
+class Reverse_Builder(BaseBuilder):
+
+    def compile(self, fun):
+        return lambda *args: fun(*reversed(args))
+
+
+def test_get_builder_builtin():
+    from loial.builders.cc_builder import CC_Builder
+    from loial.builders.python_builder import Python_Builder
+    assert get_builder('CC') is CC_Builder
+    assert get_builder('Python') is Python_Builder
+    assert get_builder('Unknown') is None
+
+
+def test_build_unregistered_subclass():
+    @build(code_type='Reverse')
+    def sub(a, b):
+        return a - b
+    assert sub(1, 3) == 2
+
+
+def test_build_registered_lazy_builder(monkeypatch):
+    monkeypatch.setitem(builders._registry, 'Lazy',
+                        f'{__name__}:Reverse_Builder')
+    assert get_builder('Lazy') is Reverse_Builder
+
+    @build(code_type='Lazy')
+    def lazy(a, b):
+        return a - b
+    assert lazy(1, 3) == 2
+
+
+def test_build_entry_point_builder(monkeypatch, mocker):
+    monkeypatch.setattr(builders, '_entry_points_loaded', False)
+    monkeypatch.setattr(builders, '_registry', dict(builders._registry))
+    mocker.patch('importlib.metadata.entry_points', return_value=[
+        importlib.metadata.EntryPoint(name='Plugin', value=f'{__name__}:Reverse_Builder',
+                                      group=builders.ENTRY_POINT_GROUP)])
+    assert get_builder('Plugin') is Reverse_Builder
+
+
+def test_import_is_lazy():
+    out = subprocess.run([sys.executable, '-c', 'import sys, loial; print(sorted(m for m in sys.modules if m.startswith("loial")))'],
+                         text=True, capture_output=True, check=True,
+                         cwd=pathlib.Path(__file__).parent.parent)
+    assert 'loial.builders.cc_builder' not in out.stdout
+    assert 'loial.builders.python_builder' not in out.stdout